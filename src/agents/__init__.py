@@ -1,26 +1,81 @@
+from collections.abc import Mapping
+import importlib
+
 from .base import Agent, PassiveAgent, ActiveAgent
 
 
-agents = {
-    'human': None
-}
+class AgentsRegistry(Mapping):
+    """
+    Agent classes by name.
+
+    Names are known up front together with modules defining agents, module is imported when class of its agent
+    is needed for the first time, so choosing one agent does not import all of them.
+    """
+
+    def __init__(self, modules):
+        self.__modules = dict(modules)
+        self.__classes = {'human': None}
+
+    def __getitem__(self, name):
+        if name not in self.__classes:
+            importlib.import_module(f'.{self.__modules[name]}', __name__)
+        return self.__classes[name]
+
+    def __iter__(self):
+        return iter(['human', *self.__modules.keys()])
+
+    def __len__(self):
+        return len(self.__modules) + 1
+
+    def __contains__(self, name):
+        return name == 'human' or name in self.__modules
+
+    def register(self, cls):
+        name = cls.NAME
+        if name in self.__classes:
+            raise Exception(f'Agent name was already taken: {name}')
+        self.__modules.setdefault(name, cls.__module__.rpartition('.')[2])
+        self.__classes[name] = cls
+
+
+agents = AgentsRegistry({
+    'random': 'random',
+    'value_iter': 'value_iteration',
+    'mcts': 'mcts',
+    'mcts_value': 'mcts',
+    'sarsa': 'sarsa',
+    'exp_sarsa': 'expected_sarsa',
+    'sarsa_lambda': 'sarsa_lambda',
+    'q_learning': 'q_learning',
+    'dq_learning': 'double_q_learning',
+    'value_approx': 'value_approx',
+    'ntuple': 'ntuple',
+})
 
 
 def agent(cls):
-    name = cls.NAME
-    if name in agents.keys():
-        raise Exception(f'Agent name was already taken: {name}')
-    cls.agent_name = name
-    agents[name] = cls
+    cls.agent_name = cls.NAME
+    agents.register(cls)
     return cls
 
 
-from .random import RandomAgent
-from .value_iteration import ValueIterAgent
-from .mcts import MctsAgent
-from .sarsa import SarsaAgent
-from .expected_sarsa import ExpectedSarsaAgent
-from .sarsa_lambda import SarsaLambdaAgent
-from .q_learning import QLearningAgent
-from .double_q_learning import DoubleQLearningAgent
-from .value_approx import ValueApproximationAgent
+# agent classes are imported from their modules only when they are used
+_CLASSES_MODULES = {
+    'RandomAgent': 'random',
+    'ValueIterAgent': 'value_iteration',
+    'MctsAgent': 'mcts',
+    'MctsValueAgent': 'mcts',
+    'SarsaAgent': 'sarsa',
+    'ExpectedSarsaAgent': 'expected_sarsa',
+    'SarsaLambdaAgent': 'sarsa_lambda',
+    'QLearningAgent': 'q_learning',
+    'DoubleQLearningAgent': 'double_q_learning',
+    'ValueApproximationAgent': 'value_approx',
+    'NTupleAgent': 'ntuple',
+}
+
+
+def __getattr__(name):
+    if name not in _CLASSES_MODULES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return getattr(importlib.import_module(f'.{_CLASSES_MODULES[name]}', __name__), name)
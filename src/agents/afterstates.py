@@ -0,0 +1,73 @@
+import numpy as np
+
+from .qtable import QTable
+from exceptions import DomainException
+
+
+class AfterstateTable:
+    """
+    Table of afterstate values used by tabular agents instead of action values.
+
+    Value of (state, action) is the value of state just after the action, before opponent move. Many pairs
+    lead to the same afterstate, so they share one entry and experience of one pair updates all of them.
+    Afterstates are computed with function given by gameplay, which is not persisted with the table.
+    """
+
+    def __init__(self):
+        self.__values = {}
+        self.__get_afterstates = None
+
+    def __len__(self):
+        return len(self.__values)
+
+    def __getstate__(self):
+        # state is taken from shallow copy, so attributes names are mangled by Python
+        table = object.__new__(type(self))
+        table.__dict__.update(self.__dict__)
+        table.__get_afterstates = None
+        return table.__dict__
+
+    @staticmethod
+    def from_data(data, get_afterstates):
+        """ Creates table from saved data and binds it to function computing afterstates """
+        if data is not None and not isinstance(data, AfterstateTable):
+            raise DomainException('Saved agent data holds action values, not afterstate values')
+
+        table = data if data is not None else AfterstateTable()
+        table.__get_afterstates = get_afterstates
+        return table
+
+    def states(self):
+        return self.__values.keys()
+
+    def get(self, state, action):
+        if action is None:
+            return 0.0
+        return self.__values.get(self.__get_afterstate(state, action), 0.0)
+
+    def set(self, state, action, value):
+        self.__values[self.__get_afterstate(state, action)] = float(value)
+
+    def add(self, state, action, delta):
+        afterstate = self.__get_afterstate(state, action)
+        self.__values[afterstate] = self.__values.get(afterstate, 0.0) + delta
+
+    def get_values(self, state, actions):
+        if len(actions) == 0:
+            return np.zeros(0)
+        afterstates = self.__get_afterstates(state, actions)
+        return np.array([self.__values.get(afterstate, 0.0) for afterstate in afterstates])
+
+    def get_max(self, state, actions):
+        if len(actions) == 0:
+            return 0.0
+        return float(np.max(self.get_values(state, actions)))
+
+    def get_best_action(self, state, actions):
+        """ Returns random action from actions with the highest value """
+        if len(actions) == 0:
+            return None
+        return QTable.choose_best_action(actions, self.get_values(state, actions))
+
+    def __get_afterstate(self, state, action):
+        return self.__get_afterstates(state, [action])[0]
@@ -2,6 +2,8 @@ from abc import ABC, abstractmethod
 import pickle
 from pathlib import Path
 
+from .qtable import QTable, QTablesFile
+
 
 class Agent(ABC):
     """ Base agent class """
@@ -15,6 +17,13 @@ class Agent(ABC):
         self.last_action = None
         self.last_state = None
 
+        # time of time.perf_counter by which current decision should be made, None when time is not limited
+        self.deadline = None
+
+        # whether tables of action values are saved with float16 values
+        self.half_precision = False
+        self.__tables_file = None
+
     # ---------- primary methods to create derived agents ------------
 
     @abstractmethod
@@ -22,6 +31,14 @@ class Agent(ABC):
         """ Called every time agent should make a decision """
         pass
 
+    def get_actions(self, states):
+        """ Called when agent should make decisions in many games at once, by default decides one by one """
+        return [self.get_action(state) for state in states]
+
+    def ponder(self, state, stop):
+        """ Called in background thread during opponent's turn, may think about given state until stop event is set """
+        pass
+
     def initialize(self):
         """ Called once before all games """
         pass
@@ -48,26 +65,64 @@ class Agent(ABC):
         """ Should initialize agent with previously persisted data """
         pass
 
+    def get_data_dependencies(self):
+        """ Should return names of other agents whose saved data is loaded together with data of this agent """
+        return []
+
     # ----- methods not intended to use in derived classes -------
 
     def load_data(self, path):
-        """ Initialize agent with data stored given file """
+        """ Initialize agent with data stored given file, tables of action values are memory-mapped if not learning """
         path = Path(path)
-        if path.exists():
+        tables_file = QTablesFile(path)
+        # agent saved in both formats, e.g. by older version, is loaded from the newer file
+        if tables_file.exists() and (not path.exists() or tables_file.path.stat().st_mtime >= path.stat().st_mtime):
+            print(f'Loading {self.NAME} agent data...')
+            tables = tables_file.load(mmap=not self.learn)
+            self.set_saved_data(tables[0] if len(tables) == 1 else tables)
+        elif path.exists():
             print(f'Loading {self.NAME} agent data...')
             with open(path, 'rb') as f:
                 data = pickle.load(f)
                 self.set_saved_data(data)
 
     def save_data(self, path):
-        """ Saves agent data in given file """
+        """ Saves agent data in given file, tables of action values are saved in binary file next to it """
         print(f'Saving {self.NAME} agent data...')
         data_to_save = self.get_data_to_save()
         if data_to_save is None:
             return
+
+        tables = self.__get_tables(data_to_save)
+        if tables is not None:
+            self.__get_tables_file(path).save(tables)
+            return
         with open(path, 'wb') as f:
             return pickle.dump(data_to_save, f)
 
+    def checkpoint_data(self, path):
+        """ Saves agent data during learning, tables of action values are written in background thread """
+        tables = self.__get_tables(self.get_data_to_save())
+        if tables is not None:
+            self.__get_tables_file(path).save_in_background(tables)
+        else:
+            self.save_data(path)
+
+    def __get_tables_file(self, path):
+        # the same file object is reused, so saving waits for writing started in background
+        tables_file = QTablesFile(path, self.half_precision)
+        if self.__tables_file is None or self.__tables_file.path != tables_file.path:
+            self.__tables_file = tables_file
+        return self.__tables_file
+
+    @staticmethod
+    def __get_tables(data):
+        if isinstance(data, QTable):
+            return [data]
+        if isinstance(data, list) and data and all(isinstance(table, QTable) for table in data):
+            return data
+        return None
+
 
 class PassiveAgent(Agent, ABC):
     """ Agent which knows everything about environment """
@@ -83,3 +138,5 @@ class ActiveAgent(Agent, ABC):
     def __init__(self):
         super().__init__()
         self.get_possible_actions = None
+        self.get_afterstates = None
+        self.size = None
@@ -0,0 +1,48 @@
+from collections import OrderedDict
+
+
+class LruCache:
+    """ Mapping of limited capacity which drops the least recently used entries and counts hits and misses """
+
+    def __init__(self, capacity):
+        self.__capacity = capacity
+        self.__entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    @property
+    def capacity(self):
+        return self.__capacity
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def get(self, key):
+        """ Returns cached value or None """
+        value = self.__entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.__capacity <= 0:
+            return
+        self.__entries[key] = value
+        self.__entries.move_to_end(key)
+        if len(self.__entries) > self.__capacity:
+            self.__entries.popitem(last=False)
+
+    def clear(self):
+        """ Drops all entries, statistics are kept """
+        self.__entries.clear()
+
+    def get_stats(self):
+        return {'size': len(self), 'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate}
@@ -1,7 +1,11 @@
 from collections import defaultdict
 import random
 
+import numpy as np
+
 from . import ActiveAgent, agent
+from .qtable import QTable
+from .replay import ReplayBuffer
 
 
 @agent
@@ -11,14 +15,25 @@ class DoubleQLearningAgent(ActiveAgent):
     DEFAULT_ALPHA = 0.2
     DEFAULT_EPSILON = 0.25
     DEFAULT_DISCOUNT = 0.99
-
-    def __init__(self, alpha=DEFAULT_ALPHA, epsilon=DEFAULT_EPSILON, discount=DEFAULT_DISCOUNT):
+    DEFAULT_REPLAY_CAPACITY = 0
+    DEFAULT_BATCH_SIZE = 32
+
+    def __init__(
+            self,
+            alpha=DEFAULT_ALPHA,
+            epsilon=DEFAULT_EPSILON,
+            discount=DEFAULT_DISCOUNT,
+            replay_capacity=DEFAULT_REPLAY_CAPACITY,
+            batch_size=DEFAULT_BATCH_SIZE
+    ):
         super().__init__()
         self.__base_alpha = alpha
         self.__base_epsilon = epsilon
         self.__discount = discount
-        self.__qvalues1 = defaultdict(_default_dict_factory)
-        self.__qvalues2 = defaultdict(_default_dict_factory)
+        self.__qvalues1 = None
+        self.__qvalues2 = None
+        self.__replay = ReplayBuffer(replay_capacity) if replay_capacity > 0 else None
+        self.__batch_size = batch_size
 
     # ------- aux stuff ------
 
@@ -30,9 +45,6 @@ class DoubleQLearningAgent(ActiveAgent):
     def __epsilon(self):
         return self.__base_epsilon if self.learn else 0
 
-    def __get_qvalue(self, state, action):
-        return self.__qvalues1[state][action] + self.__qvalues2[state][action]
-
     def get_data_to_save(self):
         return [self.__qvalues1, self.__qvalues2]
 
@@ -42,6 +54,11 @@ class DoubleQLearningAgent(ActiveAgent):
 
     # ------- main stuff ------
 
+    def initialize(self):
+        super().initialize()
+        self.__qvalues1 = QTable.from_data(self.__qvalues1, self.size)
+        self.__qvalues2 = QTable.from_data(self.__qvalues2, self.size)
+
     def get_action(self, state):
         possible_actions = self.get_possible_actions(state)
 
@@ -56,13 +73,54 @@ class DoubleQLearningAgent(ActiveAgent):
             return self.__get_best_action(state)
 
     def update(self, state, action, reward, next_state):
+        if not self.learn:
+            return
+
         qa, qb = random.choice([
             [self.__qvalues1, self.__qvalues2],
             [self.__qvalues2, self.__qvalues1]
         ])
 
         expr = reward + self.__discount * self.__get_value(qa, qb, next_state)
-        qa[state][action] = (1 - self.__alpha) * qa[state][action] + self.__alpha * expr
+        qa.set(state, action, (1 - self.__alpha) * qa.get(state, action) + self.__alpha * expr)
+
+        if self.__replay is not None:
+            self.__remember(state, action, reward, next_state)
+            self.__replay_batch()
+
+    def __remember(self, state, action, reward, next_state):
+        row1, column = self.__qvalues1.get_index(state, action)
+        row2, _ = self.__qvalues2.get_index(state, action)
+        self.__replay.add(
+            row1=row1,
+            row2=row2,
+            column=column,
+            reward=np.float32(reward),
+            next_row1=self.__qvalues1.get_row_index(next_state),
+            next_row2=self.__qvalues2.get_row_index(next_state),
+            next_mask=self.__qvalues1.get_actions_mask(self.get_possible_actions(next_state))
+        )
+
+    def __replay_batch(self):
+        if len(self.__replay) < self.__batch_size:
+            return
+
+        batch = self.__replay.sample(self.__batch_size)
+        first_updated = np.random.random(self.__batch_size) < 0.5
+        self.__replay_update(self.__qvalues1, self.__qvalues2, '1', '2', batch, first_updated)
+        self.__replay_update(self.__qvalues2, self.__qvalues1, '2', '1', batch, ~first_updated)
+
+    def __replay_update(self, qa, qb, a_suffix, b_suffix, batch, selected):
+        rows, columns, rewards = batch['row' + a_suffix][selected], batch['column'][selected], batch['reward'][selected]
+        next_masks = batch['next_mask'][selected]
+
+        best_columns = qa.get_masked_argmax(batch['next_row' + a_suffix][selected], next_masks)
+        next_values = qb.get_at(batch['next_row' + b_suffix][selected], best_columns)
+        next_values = np.where(next_masks.any(axis=1), next_values, 0)
+
+        targets = rewards + self.__discount * next_values
+        deltas = targets - qa.get_at(rows, columns)
+        qa.add_mean_at(rows, columns, self.__alpha * deltas)
 
     def __get_value(self, qa, qb, state):
         possible_actions = self.get_possible_actions(state)
@@ -70,12 +128,8 @@ class DoubleQLearningAgent(ActiveAgent):
         if len(possible_actions) == 0:
             return 0.0
 
-        actions_values = [qa[state][action] for action in possible_actions]
-        max_action_value = max(actions_values)
-        best_actions = [action for action, value in zip(possible_actions, actions_values) if value == max_action_value]
-        best_action = random.choice(best_actions)
-
-        return qb[state][best_action]
+        best_action = qa.get_best_action(state, possible_actions)
+        return qb.get(state, best_action)
 
     def __get_best_action(self, state):
         possible_actions = self.get_possible_actions(state)
@@ -83,19 +137,15 @@ class DoubleQLearningAgent(ActiveAgent):
         if len(possible_actions) == 0:
             return None
 
-        qvalues = [self.__get_qvalue(state, action) for action in possible_actions]
-        best_qvalue = max(qvalues)
-        best_actions = [action for action, qvalue in zip(possible_actions, qvalues) if qvalue == best_qvalue]
-        best_action = random.choice(best_actions)
-
-        return best_action
+        qvalues = self.__qvalues1.get_values(state, possible_actions) + self.__qvalues2.get_values(state, possible_actions)
+        return QTable.choose_best_action(possible_actions, qvalues)
 
 
-# must be standard function, not lambda, to allow pickling
+# legacy pickled data references this factory, so it must stay importable
 def _default_dict_factory():
     return defaultdict(_zero_factory)
 
 
-# must be standard function, not lambda, to allow pickling
+# legacy pickled data references this factory, so it must stay importable
 def _zero_factory():
     return 0
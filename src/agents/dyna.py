@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+
+
+class DynaModel:
+    """
+    Model of environment used for Dyna-style planning.
+
+    Remembers the last observed outcome (reward, next state row and its legal actions mask) of every
+    QTable (row, column) pair in flat arrays, and replays them as simulated experience.
+    """
+
+    INITIAL_CAPACITY = 1024
+    PLANNING_BATCH_SIZE = 16
+
+    def __init__(self):
+        self.__slots = {}
+        self.__arrays = None
+
+    def __len__(self):
+        return len(self.__slots)
+
+    def observe(self, row, column, reward, next_row, next_mask):
+        slot = self.__slots.get((row, column))
+        if slot is None:
+            slot = len(self.__slots)
+            self.__slots[(row, column)] = slot
+
+        if self.__arrays is None:
+            self.__arrays = self.__allocate(len(next_mask))
+        elif slot >= len(self.__arrays['row']):
+            self.__grow()
+
+        self.__arrays['row'][slot] = row
+        self.__arrays['column'][slot] = column
+        self.__arrays['reward'][slot] = reward
+        self.__arrays['next_row'][slot] = next_row
+        self.__arrays['next_mask'][slot] = next_mask
+
+    def sample(self, batch_size):
+        indices = np.random.randint(0, len(self.__slots), size=batch_size)
+        return {name: array[indices] for name, array in self.__arrays.items()}
+
+    def plan(self, steps, max_time, update):
+        """ Calls update with batches of simulated transitions, until steps transitions or max_time seconds pass """
+        if len(self.__slots) == 0:
+            return
+
+        deadline = time.perf_counter() + max_time if max_time is not None else None
+        done_steps = 0
+
+        while done_steps < steps and (deadline is None or time.perf_counter() < deadline):
+            batch_size = min(self.PLANNING_BATCH_SIZE, steps - done_steps)
+            update(self.sample(batch_size))
+            done_steps += batch_size
+
+    def __allocate(self, actions_count):
+        return {
+            'row': np.zeros(self.INITIAL_CAPACITY, dtype=np.int64),
+            'column': np.zeros(self.INITIAL_CAPACITY, dtype=np.int64),
+            'reward': np.zeros(self.INITIAL_CAPACITY, dtype=np.float32),
+            'next_row': np.zeros(self.INITIAL_CAPACITY, dtype=np.int64),
+            'next_mask': np.zeros((self.INITIAL_CAPACITY, actions_count), dtype=bool),
+        }
+
+    def __grow(self):
+        self.__arrays = {name: np.concatenate([array, np.zeros_like(array)]) for name, array in self.__arrays.items()}
@@ -1,4 +1,7 @@
+import numpy as np
+
 from . import agent, SarsaAgent
+from .qtable import QTable
 
 
 @agent
@@ -8,9 +11,20 @@ class ExpectedSarsaAgent(SarsaAgent):
     DEFAULT_ALPHA = 0.2
     DEFAULT_EPSILON = 0.25
     DEFAULT_DISCOUNT = 0.99
-
-    def __init__(self, alpha=DEFAULT_ALPHA, epsilon=DEFAULT_EPSILON, discount=DEFAULT_DISCOUNT):
-        super().__init__(alpha, epsilon, discount)
+    DEFAULT_PLANNING_STEPS = 0
+    DEFAULT_PLANNING_TIME = None
+    DEFAULT_AFTERSTATES = False
+
+    def __init__(
+            self,
+            alpha=DEFAULT_ALPHA,
+            epsilon=DEFAULT_EPSILON,
+            discount=DEFAULT_DISCOUNT,
+            planning_steps=DEFAULT_PLANNING_STEPS,
+            planning_time=DEFAULT_PLANNING_TIME,
+            afterstates=DEFAULT_AFTERSTATES
+    ):
+        super().__init__(alpha, epsilon, discount, planning_steps, planning_time, afterstates)
 
     def _get_value(self, state):
         possible_actions = self.get_possible_actions(state)
@@ -18,18 +32,17 @@ class ExpectedSarsaAgent(SarsaAgent):
         if len(possible_actions) == 0:
             return 0.0
 
-        value = 0
-        for action in possible_actions:
-            prob = self.__get_action_prob_following_strategy(state, action)
-            q = self._get_qvalue(state, action)
-            value += prob * q
+        qvalues = self._qvalues.get_values(state, possible_actions)
+        probs = self.__get_actions_probs_following_strategy(possible_actions, qvalues)
+        return float(probs @ qvalues)
 
-        return value
+    def _get_batch_values(self, rows, masks):
+        max_values = self._qvalues.get_masked_max(rows, masks)
+        mean_values = self._qvalues.get_masked_mean(rows, masks)
+        return (1 - self._epsilon) * max_values + self._epsilon * mean_values
 
-    def __get_action_prob_following_strategy(self, state, action):
-        possible_actions = self.get_possible_actions(state)
-        best_action = self._get_best_action(state)
-        if action == best_action:
-            return 1 - self._epsilon + self._epsilon / len(possible_actions)
-        else:
-            return self._epsilon / len(possible_actions)
+    def __get_actions_probs_following_strategy(self, possible_actions, qvalues):
+        best_action_index = possible_actions.index(QTable.choose_best_action(possible_actions, qvalues))
+        probs = np.full(len(possible_actions), self._epsilon / len(possible_actions))
+        probs[best_action_index] += 1 - self._epsilon
+        return probs
@@ -0,0 +1,111 @@
+from functools import lru_cache
+
+import numpy as np
+
+from board import Side
+
+
+class BoardFeatures:
+    """
+    Extracts features used by value approximation agents from many boards at once.
+
+    For every side features are: legal moves count, discs count, corner, edge and diagonal discs counts,
+    all divided by fields count, and discs densities in consecutive rings from the edge to the center.
+    Counts are computed as products of flattened boards with weight masks precomputed for board size.
+    """
+
+    DIRECTIONS = [(dy, dx) for dy in [-1, 0, 1] for dx in [-1, 0, 1] if not (dy == 0 and dx == 0)]
+
+    def __init__(self, size):
+        self.__size = tuple(size)
+        self.__masks = self.__create_masks(self.__size)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def for_size(size):
+        """ Returns shared extractor for given board size """
+        return BoardFeatures(size)
+
+    @property
+    def features_count(self):
+        return 2 * (1 + self.__masks.shape[1])
+
+    def get_features(self, boards):
+        """ Returns (boards, features) matrix for array of boards with shape (boards, height, width) """
+        boards = np.asarray(boards).reshape(-1, *self.__size)
+        fields_count = self.__size[0] * self.__size[1]
+
+        features = []
+        for side in [Side.ME, Side.OPPONENT]:
+            moves_count = self.get_legal_moves_masks(boards, side).sum(axis=(1, 2)) / fields_count
+            discs = (boards == side).reshape(len(boards), -1).astype(np.float64)
+            features.append(moves_count[:, np.newaxis])
+            features.append(discs @ self.__masks)
+        return np.concatenate(features, axis=1)
+
+    @staticmethod
+    def get_legal_moves_masks(boards, side):
+        """ Returns boolean array marking fields where given side can move on every board """
+        own = boards == side
+        opponent = boards == -side
+        legal = np.zeros(boards.shape, dtype=bool)
+        max_distance = max(boards.shape[1:])
+
+        for dy, dx in BoardFeatures.DIRECTIONS:
+            # fields followed by unbroken line of opponent discs of given length in direction
+            line = BoardFeatures.__shift(opponent, dy, dx)
+            for distance in range(2, max_distance):
+                if not line.any():
+                    break
+                legal |= line & BoardFeatures.__shift(own, dy * distance, dx * distance)
+                line &= BoardFeatures.__shift(opponent, dy * distance, dx * distance)
+
+        return legal & (boards == Side.ANY)
+
+    @staticmethod
+    def __shift(array, dy, dx):
+        """ Returns array where every field holds value of field (y + dy, x + dx), False outside of board """
+        shifted = np.zeros_like(array)
+        height, width = array.shape[1:]
+        if abs(dy) >= height or abs(dx) >= width:
+            return shifted
+        source_y = slice(max(dy, 0), height + min(dy, 0))
+        source_x = slice(max(dx, 0), width + min(dx, 0))
+        target_y = slice(max(-dy, 0), height + min(-dy, 0))
+        target_x = slice(max(-dx, 0), width + min(-dx, 0))
+        shifted[:, target_y, target_x] = array[:, source_y, source_x]
+        return shifted
+
+    @staticmethod
+    def __create_masks(size):
+        fields = np.arange(size[0] * size[1]).reshape(size)
+        fields_count = fields.size
+        masks = []
+
+        def add_mask(selected_fields, divisor):
+            mask = np.zeros(fields_count)
+            np.add.at(mask, np.asarray(selected_fields).flatten(), 1 / divisor)
+            masks.append(mask)
+
+        add_mask(fields, fields_count)
+        add_mask(fields[np.ix_((0, -1), (0, -1))], fields_count)
+        add_mask(np.concatenate([fields[1:-1, (0, -1)].flatten(), fields[(0, -1), 1:-1].flatten()]), fields_count)
+
+        diagonal_fields = []
+        ring = fields
+        while ring.shape[0] >= 2 and ring.shape[1] >= 2:
+            diagonal_fields.extend(ring[np.ix_((0, -1), (0, -1))].flatten())
+            ring = ring[1:-1, 1:-1]
+        add_mask(diagonal_fields, fields_count)
+
+        ring = fields
+        while ring.shape[0] >= 2 and ring.shape[1] >= 2:
+            max_count_in_ring = 4 + 2 * (ring.shape[0] - 2) + 2 * (ring.shape[1] - 2)
+            inner = ring[1:-1, 1:-1]
+            add_mask(np.setdiff1d(ring, inner), max_count_in_ring)
+            ring = inner
+
+        if ring.size > 0:
+            add_mask(ring, ring.size)
+
+        return np.stack(masks, axis=1)
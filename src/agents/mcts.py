@@ -1,9 +1,18 @@
 import math
 import random
-from collections import defaultdict
+import time
+from functools import lru_cache
+from itertools import count
+from pathlib import Path
+
+import numpy as np
 
 from . import PassiveAgent, agent
-from board import Side
+from .mcts_stats import PositionsStats
+from .value_approx import ValueApproximationAgent
+from board import Board, Side
+from environment import Environment
+from exceptions import DomainException
 
 
 @agent
@@ -11,49 +20,107 @@ class MctsAgent(PassiveAgent):
 
     NAME = 'mcts'
     DEFAULT_C = 4
-
-    def __init__(self, c=DEFAULT_C):
+    DEFAULT_CHECKPOINT_INTERVAL = 100
+    DEFAULT_SYMMETRIC = True
+    DEFAULT_VALUE_WEIGHT = 0
+    DEFAULT_ITERATIONS = 0
+
+    def __init__(
+            self,
+            c=DEFAULT_C,
+            checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+            symmetric=DEFAULT_SYMMETRIC,
+            value_weight=DEFAULT_VALUE_WEIGHT,
+            iterations=DEFAULT_ITERATIONS
+    ):
         super().__init__()
         self.__base_c = c
-        self.__positions_stats = defaultdict(self._default_dict_factory)
+        self.__checkpoint_interval = checkpoint_interval
+        self.__symmetric = symmetric
+        self.__value_weight = value_weight
+        self.__iterations = iterations
+        self.__evaluator = None
+        self.__positions_stats = PositionsStats()
+        self.__stats_path = None
+        self.__games_count = 0
 
     # ------- aux stuff ------
 
+    # legacy pickled data references this factory, so it must stay importable
     @staticmethod
     def _default_dict_factory():
         return [0, 0]
 
-    def get_data_to_save(self):
-        print(f'There is {len(self.__positions_stats)} nodes in MCTS tree')
-        return self.__positions_stats
+    def initialize(self):
+        super().initialize()
+        if self.__value_weight > 0:
+            if self.__evaluator is None:
+                raise DomainException(f'{self.NAME} agent requires learned {ValueApproximationAgent.NAME} agent data')
+            self.__evaluator.env = self.env
+
+    def load_data(self, path):
+        if self.__value_weight > 0:
+            self.__load_evaluator(Path(path).with_name(f'{ValueApproximationAgent.NAME}{Path(path).suffix}'))
+
+        self.__stats_path = Path(path).with_suffix(PositionsStats.SUFFIX)
+        if self.__stats_path.exists():
+            print(f'Loading {self.NAME} agent data...')
+            self.__positions_stats = PositionsStats.open(self.__stats_path)
+            self.__print_stats_info()
+        else:
+            super().load_data(path)
+
+    def get_data_dependencies(self):
+        return [ValueApproximationAgent.NAME] if self.__value_weight > 0 else []
+
+    def save_data(self, path):
+        print(f'Saving {self.NAME} agent data...')
+        self.__positions_stats.save(Path(path).with_suffix(PositionsStats.SUFFIX))
+        self.__print_stats_info()
 
     def set_saved_data(self, data):
-        self.__positions_stats = data
-        print(f'There is {len(self.__positions_stats)} nodes in MCTS tree')
+        self.__positions_stats = PositionsStats.from_dict(data)
+        self.__print_stats_info()
 
-    @property
-    def __c(self):
-        return self.__base_c if self.learn else 0
+    def after_gameplay(self):
+        self.__games_count += 1
+        if self.learn and self.__stats_path is not None and self.__games_count % self.__checkpoint_interval == 0:
+            self.__positions_stats.save(self.__stats_path)
+
+    def __load_evaluator(self, path):
+        if not path.exists():
+            return
+        self.__evaluator = ValueApproximationAgent()
+        self.__evaluator.learn = False
+        self.__evaluator.load_data(path)
+
+    def __print_stats_info(self):
+        stats = self.__positions_stats
+        print(f'There is {stats.entries_count} entries in {stats.segments_count} segments of MCTS table')
+
+    def __get_key(self, position):
+        # symmetric positions share statistics, moves are always made on real positions, so they need no mapping
+        if not self.__symmetric:
+            return position
+        return get_canonical_position(position, self.env.size)
 
     def __get_position_total(self, position):
-        return self.__positions_stats[position][0]
+        return self.__positions_stats.get(self.__get_key(position))[0]
 
     def __get_position_visits(self, position):
-        return self.__positions_stats[position][1]
+        return self.__positions_stats.get(self.__get_key(position))[1]
 
     def __get_position_value(self, position):
-        total = self.__positions_stats[position][0]
-        visits = self.__positions_stats[position][1]
+        total, visits = self.__positions_stats.get(self.__get_key(position))
         return total / visits
 
     def __update_position(self, position, reward):
-        self.__positions_stats[position][0] += reward
-        self.__positions_stats[position][1] += 1
+        self.__positions_stats.update(self.__get_key(position), reward)
 
     def __is_position_known(self, position):
         return self.__get_position_visits(position) > 0
 
-    def __ucb(self, parent_position, child_position):
+    def __ucb(self, parent_position, child_position, c):
         parent_n = self.__get_position_visits(parent_position)
         child_n = self.__get_position_visits(child_position)
 
@@ -62,7 +129,7 @@ class MctsAgent(PassiveAgent):
 
         exploitation = self.__get_position_value(child_position)
         exploration = math.sqrt(math.log(parent_n) / child_n)
-        ucb = exploitation + self.__c * exploration
+        ucb = exploitation + c * exploration
         return ucb
 
     # ------- main stuff ------
@@ -70,20 +137,37 @@ class MctsAgent(PassiveAgent):
     def get_action(self, state):
         position = self.env.get_simulation_from_state(state).number
 
-        if self.learn:
+        if self.deadline is not None:
+            # deadline is read in every iteration, so decision can be cut short by moving it forward
+            self.__search(position, lambda: time.perf_counter() >= self.deadline)
+        elif self.__iterations > 0:
+            iterations = count(1)
+            self.__search(position, lambda: next(iterations) >= self.__iterations)
+        elif self.learn:
             self.__learn(position)
 
-        return self.__select_move(position)
+        return self.__select_move(position, explore=self.learn)
+
+    def ponder(self, state, stop):
+        # statistics are kept per position, so search from opponent's position is reused after its move
+        position = self.env.get_simulation_from_state(state, Side.OPPONENT).number
+        self.__search(position, stop.is_set)
+
+    def __search(self, root_position, should_stop):
+        """ Runs search iterations from given position until should_stop returns True, at least one """
+        self.__learn(root_position)
+        while not should_stop():
+            self.__learn(root_position)
 
     def __learn(self, root_position):
         path = self.__select_path(root_position)
 
         if len(path) == 0:
-            reward = self.__rollout(root_position)
+            reward = self.__evaluate(root_position)
             self.__update_position(root_position, reward)
         else:
             self.__expand(path)
-            reward = self.__rollout(path[-1])
+            reward = self.__evaluate(path[-1])
             self.__backpropagate(path, reward)
 
     def __select_path(self, root_position):
@@ -96,22 +180,23 @@ class MctsAgent(PassiveAgent):
             if simulation.is_finished():
                 break
 
-            move = self.__select_move(simulation.number)
+            move = self.__select_move(simulation.number, explore=True)
             simulation.make_move(move)
 
         return path
 
-    def __select_move(self, position):
+    def __select_move(self, position, explore):
         simulation = self.env.get_simulation_from_position(position)
         moves = simulation.get_moves()
         positions = [simulation.copy().make_move(move).number for move in moves]
 
-        if self.learn:
+        if explore:
             undiscovered_moves = [move for move, position in zip(moves, positions) if not self.__is_position_known(position)]
             if len(undiscovered_moves) > 0:
                 return random.choice(undiscovered_moves)
 
-        ucb_values = [self.__ucb(simulation.number, position) for position in positions]
+        c = self.__base_c if explore else 0
+        ucb_values = [self.__ucb(simulation.number, position, c) for position in positions]
         max_ucb_value = max(ucb_values)
         best_moves = [move for move, ucb_value in zip(moves, ucb_values) if ucb_value == max_ucb_value]
         best_move = random.choice(best_moves)
@@ -128,17 +213,66 @@ class MctsAgent(PassiveAgent):
         new_position = simulation.number
         path.append(new_position)
 
+    def __evaluate(self, position):
+        if self.__value_weight == 0:
+            return self.__rollout(position)
+
+        simulation = self.env.get_simulation_from_position(position)
+        if simulation.is_finished():
+            return self.__get_reward(simulation.get_winner())
+
+        value = self.__get_approximated_value(simulation)
+        if self.__value_weight == 1:
+            return value
+        return (1 - self.__value_weight) * self.__rollout(position) + self.__value_weight * value
+
+    def __get_approximated_value(self, simulation):
+        # approximator evaluates boards just after move of Side.ME, so position where Side.ME is about to move
+        # is evaluated from opponent point of view
+        if simulation.turn == Side.OPPONENT:
+            value = self.__evaluator.get_board_value(simulation.board)
+        else:
+            value = -self.__evaluator.get_board_value(-simulation.board)
+        return float(np.clip(value / Environment.WIN_REWARD, -1, 1))
+
     def __rollout(self, position):
         simulation = self.env.get_simulation_from_position(position)
-        while not simulation.is_finished:
+        while not simulation.is_finished():
             possible_moves = simulation.get_moves()
             move = random.choice(possible_moves)
             simulation.make_move(move)
 
-        winner = simulation.get_winner()
-        reward = 1 if winner == Side.ME else (-1 if winner == Side.OPPONENT else 0)
-        return reward
+        return self.__get_reward(simulation.get_winner())
+
+    @staticmethod
+    def __get_reward(winner):
+        return 1 if winner == Side.ME else (-1 if winner == Side.OPPONENT else 0)
 
     def __backpropagate(self, path, reward):
         for position in path:
             self.__update_position(position, reward)
+
+
+@agent
+class MctsValueAgent(MctsAgent):
+    """ MCTS evaluating leaves with learned value_approx agent instead of random rollouts """
+
+    NAME = 'mcts_value'
+    DEFAULT_VALUE_WEIGHT = 1
+
+    def __init__(
+            self,
+            c=MctsAgent.DEFAULT_C,
+            checkpoint_interval=MctsAgent.DEFAULT_CHECKPOINT_INTERVAL,
+            symmetric=MctsAgent.DEFAULT_SYMMETRIC,
+            value_weight=DEFAULT_VALUE_WEIGHT,
+            iterations=MctsAgent.DEFAULT_ITERATIONS
+    ):
+        super().__init__(c, checkpoint_interval, symmetric, value_weight, iterations)
+
+
+@lru_cache(maxsize=2 ** 16)
+def get_canonical_position(position, size):
+    """ Returns number of position canonical among symmetric ones, cached outside agents so they stay picklable """
+    turn_bit = position & 1
+    return Board.create_from_number(position >> 1, size).get_canonical().number << 1 | turn_bit
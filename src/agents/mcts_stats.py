@@ -0,0 +1,259 @@
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from exceptions import DomainException
+
+
+class PositionsStats:
+    """
+    Table of MCTS (total, visits) statistics.
+
+    Persisted statistics live in a binary file made of append-only segments. Every segment holds sorted
+    position keys with float32 totals and uint32 visits deltas, so the table is a sum of all segments and
+    of not yet persisted updates. Segments are memory-mapped instead of being read into memory.
+
+    Keys are stored as little-endian bytes of the position number, which makes them independent of
+    the key width, because numpy pads byte strings with zeros on the right.
+    """
+
+    SUFFIX = '.stats'
+    MAGIC = b'MCTSSTAT'
+    VERSION = 1
+    MAX_SEGMENTS = 8
+
+    __HEADER = struct.Struct('<8sH')            # magic, version
+    __SEGMENT_HEADER = struct.Struct('<4sQH')   # magic, entries count, key width
+    __SEGMENT_MAGIC = b'SEGM'
+
+    def __init__(self):
+        self.__path = None
+        self.__valid_size = 0
+        self.__segments = []
+        self.__pending = {}
+
+    # ------- creation ------
+
+    @staticmethod
+    def from_dict(positions_stats):
+        """ Creates table from legacy dict mapping position to [total, visits] """
+        stats = PositionsStats()
+        for position, (total, visits) in positions_stats.items():
+            if visits > 0:
+                stats.__pending[position] = [total, visits]
+        return stats
+
+    @staticmethod
+    def open(path, mmap=True):
+        """ Opens table stored in given file """
+        stats = PositionsStats()
+        stats.__path = Path(path)
+        stats.__segments, stats.__valid_size = PositionsStats.__read_segments(stats.__path, mmap)
+        return stats
+
+    @staticmethod
+    def merge(paths, target_path):
+        """ Merges tables produced by separate runs into single compacted file """
+        segments = []
+        for path in paths:
+            segments.extend(PositionsStats.__read_segments(Path(path), mmap=True)[0])
+        PositionsStats.__write_file(Path(target_path), [PositionsStats.__compact_segments(segments)])
+        return PositionsStats.open(target_path)
+
+    # ------- access ------
+
+    @property
+    def segments_count(self):
+        return len(self.__segments)
+
+    @property
+    def entries_count(self):
+        """ Number of stored entries, position present in many segments is counted many times """
+        return sum(len(keys) for keys, _, _ in self.__segments) + len(self.__pending)
+
+    def get(self, position):
+        total, visits = 0.0, 0
+
+        if self.__segments:
+            key = self.__encode_key(position)
+            for keys, totals, visits_array in self.__segments:
+                if len(key) > keys.itemsize:
+                    continue
+                ix = np.searchsorted(keys, key)
+                if ix < len(keys) and keys[ix] == key:
+                    total += float(totals[ix])
+                    visits += int(visits_array[ix])
+
+        pending = self.__pending.get(position)
+        if pending is not None:
+            total += pending[0]
+            visits += pending[1]
+
+        return total, visits
+
+    def update(self, position, reward):
+        pending = self.__pending.get(position)
+        if pending is None:
+            self.__pending[position] = [reward, 1]
+        else:
+            pending[0] += reward
+            pending[1] += 1
+
+    def items(self):
+        """ Iterates over (position, total, visits) of all positions """
+        keys, totals, visits = self.__compact_segments(self.__segments + [self.__pending_as_segment()])
+        for key, total, visits_count in zip(keys, totals, visits):
+            yield self.__decode_key(key), float(total), int(visits_count)
+
+    # ------- persistence ------
+
+    def save(self, path):
+        """ Appends pending updates to file the table was opened from, or writes new compacted file """
+        path = Path(path)
+        if self.__path is not None and self.__path.resolve() == path.resolve():
+            self.checkpoint()
+        else:
+            self.__write_file(path, [self.__compact_segments(self.__segments + [self.__pending_as_segment()])])
+            self.__reopen(path)
+
+    def checkpoint(self):
+        """ Appends pending updates as new segment of the file """
+        if self.__path is None:
+            raise DomainException('MCTS statistics table is not bound to any file')
+        if not self.__pending:
+            return
+
+        with open(self.__path, 'r+b') as f:
+            f.truncate(self.__valid_size)
+            f.seek(self.__valid_size)
+            self.__write_segment(f, self.__pending_as_segment())
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.__reopen(self.__path)
+
+        if len(self.__segments) > self.MAX_SEGMENTS:
+            self.compact()
+
+    def compact(self):
+        """ Rewrites file so it contains only one segment """
+        segments = [self.__compact_segments(self.__segments + [self.__pending_as_segment()])]
+        self.__write_file(self.__path, segments)
+        self.__reopen(self.__path)
+
+    def __reopen(self, path):
+        self.__path = path
+        self.__segments, self.__valid_size = self.__read_segments(path, mmap=True)
+        self.__pending = {}
+
+    def __pending_as_segment(self):
+        positions = list(self.__pending.keys())
+        width = max([self.__get_key_width(position) for position in positions], default=1)
+        keys = np.array([self.__encode_key(position) for position in positions], dtype=f'S{width}')
+        totals = np.array([stats[0] for stats in self.__pending.values()], dtype=np.float32)
+        visits = np.array([stats[1] for stats in self.__pending.values()], dtype=np.uint32)
+        order = np.argsort(keys, kind='stable')
+        return keys[order], totals[order], visits[order]
+
+    @staticmethod
+    def __compact_segments(segments):
+        segments = [segment for segment in segments if len(segment[0]) > 0]
+        if not segments:
+            return np.array([], dtype='S1'), np.array([], dtype=np.float32), np.array([], dtype=np.uint32)
+
+        width = max(keys.itemsize for keys, _, _ in segments)
+        keys = np.concatenate([keys.astype(f'S{width}') for keys, _, _ in segments])
+        totals = np.concatenate([totals for _, totals, _ in segments])
+        visits = np.concatenate([visits for _, _, visits in segments])
+
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        unique_totals = np.bincount(inverse, weights=totals, minlength=len(unique_keys)).astype(np.float32)
+        unique_visits = np.bincount(inverse, weights=visits, minlength=len(unique_keys)).astype(np.uint32)
+        return unique_keys, unique_totals, unique_visits
+
+    @staticmethod
+    def __write_file(path, segments):
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(PositionsStats.__HEADER.pack(PositionsStats.MAGIC, PositionsStats.VERSION))
+            for segment in segments:
+                PositionsStats.__write_segment(f, segment)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def __write_segment(f, segment):
+        keys, totals, visits = segment
+        if len(keys) == 0:
+            return
+        f.write(PositionsStats.__SEGMENT_HEADER.pack(PositionsStats.__SEGMENT_MAGIC, len(keys), keys.itemsize))
+        f.write(keys.tobytes())
+        f.write(bytes(PositionsStats.__get_padding(f.tell())))
+        f.write(totals.astype('<f4').tobytes())
+        f.write(visits.astype('<u4').tobytes())
+
+    @staticmethod
+    def __read_segments(path, mmap):
+        file_size = path.stat().st_size
+        with open(path, 'rb') as f:
+            header = f.read(PositionsStats.__HEADER.size)
+
+        if len(header) < PositionsStats.__HEADER.size:
+            raise DomainException(f'File {path} is not a MCTS statistics file')
+        magic, version = PositionsStats.__HEADER.unpack(header)
+        if magic != PositionsStats.MAGIC or version != PositionsStats.VERSION:
+            raise DomainException(f'File {path} is not a MCTS statistics file')
+
+        segments = []
+        offset = PositionsStats.__HEADER.size
+
+        # segments are read until the end of file or partially written segment
+        while offset + PositionsStats.__SEGMENT_HEADER.size <= file_size:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                magic, count, width = PositionsStats.__SEGMENT_HEADER.unpack(f.read(PositionsStats.__SEGMENT_HEADER.size))
+            if magic != PositionsStats.__SEGMENT_MAGIC:
+                break
+
+            keys_offset = offset + PositionsStats.__SEGMENT_HEADER.size
+            totals_offset = keys_offset + count * width
+            totals_offset += PositionsStats.__get_padding(totals_offset)
+            visits_offset = totals_offset + count * 4
+            end_offset = visits_offset + count * 4
+            if end_offset > file_size:
+                break
+
+            keys = PositionsStats.__read_array(path, f'S{width}', keys_offset, count, mmap)
+            totals = PositionsStats.__read_array(path, '<f4', totals_offset, count, mmap)
+            visits = PositionsStats.__read_array(path, '<u4', visits_offset, count, mmap)
+            segments.append((keys, totals, visits))
+            offset = end_offset
+
+        return segments, offset
+
+    @staticmethod
+    def __read_array(path, dtype, offset, count, mmap):
+        if mmap:
+            return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            return np.fromfile(f, dtype=dtype, count=count)
+
+    @staticmethod
+    def __get_padding(offset):
+        return -offset % 4
+
+    @staticmethod
+    def __get_key_width(position):
+        return max((position.bit_length() + 7) // 8, 1)
+
+    @staticmethod
+    def __encode_key(position):
+        return position.to_bytes(PositionsStats.__get_key_width(position), 'little').rstrip(b'\x00')
+
+    @staticmethod
+    def __decode_key(key):
+        return int.from_bytes(bytes(key), 'little')
@@ -0,0 +1,172 @@
+import random
+
+import numpy as np
+
+from . import PassiveAgent, agent
+from board import Board
+from environment import Environment
+from exceptions import DomainException
+
+
+class NTupleNetwork:
+    """
+    Board evaluator made of n-tuples - fixed sequences of board fields indexing lookup tables of weights.
+
+    Every field of a tuple can be empty or occupied by one of the sides, so table of tuple with n fields
+    has 3^n weights. Tuples symmetric to each other share one table, board value is the sum of weights
+    selected by all tuples.
+    """
+
+    MAX_TUPLE_LENGTH = 9
+
+    def __init__(self, size):
+        self.__size = tuple(size)
+        base_tuples = self.__create_base_tuples(self.__size)
+        self.__tables_offsets = np.cumsum([0] + [3 ** len(cells) for cells in base_tuples])
+
+        cells, powers, starts, offsets = [], [], [], []
+        for table, base_cells in enumerate(base_tuples):
+            for tuple_cells in self.__get_symmetric_tuples(base_cells):
+                starts.append(len(cells))
+                offsets.append(self.__tables_offsets[table])
+                cells.extend(tuple_cells)
+                powers.extend(3 ** np.arange(len(tuple_cells)))
+
+        self.__cells = np.array(cells)
+        self.__powers = np.array(powers)
+        self.__starts = np.array(starts)
+        self.__offsets = np.array(offsets)
+        self.weights = np.zeros(self.__tables_offsets[-1], dtype=np.float32)
+
+    @property
+    def size(self):
+        return self.__size
+
+    @property
+    def tuples_count(self):
+        return len(self.__starts)
+
+    def get_indices(self, boards):
+        """ Returns (boards, tuples) matrix of weights indices selected by every tuple on every board """
+        boards = np.asarray(boards).reshape(-1, self.__size[0] * self.__size[1])
+        contributions = (boards[:, self.__cells] + 1) * self.__powers
+        return np.add.reduceat(contributions, self.__starts, axis=1) + self.__offsets
+
+    def get_values(self, boards):
+        return self.weights[self.get_indices(boards)].sum(axis=1)
+
+    def update(self, board, delta):
+        """ Adds delta to weights selected by board, weights of tuples sharing table accumulate """
+        np.add.at(self.weights, self.get_indices(board)[0], delta)
+
+    def __get_symmetric_tuples(self, base_cells):
+        fields = np.arange(self.__size[0] * self.__size[1]).reshape(self.__size)
+        tuples = []
+        for symmetry in Board(fields).get_symmetries():
+            symmetric_fields = symmetry.as_numpy_array().flatten()
+            tuple_cells = tuple(int(symmetric_fields[cell]) for cell in base_cells)
+            if tuple_cells not in tuples:
+                tuples.append(tuple_cells)
+        return tuples
+
+    @staticmethod
+    def __create_base_tuples(size):
+        height, width = size
+        fields = np.arange(height * width).reshape(size)
+        tuples = []
+
+        # rows and columns, up to the middle of the board because of symmetries
+        for y in range((height + 1) // 2):
+            tuples.append(fields[y, :NTupleNetwork.MAX_TUPLE_LENGTH])
+        if height != width:
+            for x in range((width + 1) // 2):
+                tuples.append(fields[:NTupleNetwork.MAX_TUPLE_LENGTH, x])
+
+        # main diagonal and corner region
+        tuples.append(np.diagonal(fields)[:NTupleNetwork.MAX_TUPLE_LENGTH])
+        tuples.append(fields[:3, :3].flatten())
+
+        return [tuple(int(cell) for cell in cells) for cells in tuples]
+
+
+@agent
+class NTupleAgent(PassiveAgent):
+    """ Agent learning values of afterstates with n-tuple network by temporal difference """
+
+    NAME = 'ntuple'
+    DEFAULT_ALPHA = 0.1
+    DEFAULT_EPSILON = 0.1
+
+    def __init__(self, alpha=DEFAULT_ALPHA, epsilon=DEFAULT_EPSILON):
+        super().__init__()
+        self.__base_alpha = alpha
+        self.__base_epsilon = epsilon
+        self.__network = None
+        self.__saved_data = None
+
+    # ------- aux stuff ------
+
+    @property
+    def __alpha(self):
+        return self.__base_alpha if self.learn else 0
+
+    @property
+    def __epsilon(self):
+        return self.__base_epsilon if self.learn else 0
+
+    def get_data_to_save(self):
+        if self.__network is None:
+            return self.__saved_data
+        return {'size': self.__network.size, 'weights': self.__network.weights}
+
+    def set_saved_data(self, data):
+        self.__saved_data = data
+        if self.__network is not None:
+            self.__load_weights()
+
+    # ------- main stuff ------
+
+    def initialize(self):
+        super().initialize()
+        self.__network = NTupleNetwork(self.env.size)
+        self.__load_weights()
+
+    def __load_weights(self):
+        if self.__saved_data is None:
+            return
+        if tuple(self.__saved_data['size']) != self.__network.size:
+            raise DomainException(f'N-tuple network data was saved for {self.__saved_data["size"]} board')
+        self.__network.weights = np.asarray(self.__saved_data['weights'], dtype=np.float32)
+        self.__saved_data = None
+
+    def get_action(self, state):
+        possible_actions = self.env.get_possible_actions(state)
+
+        if len(possible_actions) == 0:
+            return None
+
+        if random.random() < self.__epsilon:
+            return random.choice(possible_actions)
+
+        values = self.__network.get_values(self.__get_afterstates(state, possible_actions))
+        best_value = np.max(values)
+        best_actions = [action for action, value in zip(possible_actions, values) if value == best_value]
+        return random.choice(best_actions)
+
+    def update(self, state, action, reward, next_state):
+        if not self.learn:
+            return
+
+        afterstate = self.__get_afterstates(state, [action])
+        next_actions = self.env.get_possible_actions(next_state)
+        next_value = 0
+        if len(next_actions) > 0:
+            next_value = np.max(self.__network.get_values(self.__get_afterstates(next_state, next_actions)))
+
+        target = reward / Environment.WIN_REWARD + next_value
+        delta = target - self.__network.get_values(afterstate)[0]
+        self.__network.update(afterstate, self.__alpha * delta / self.__network.tuples_count)
+
+    def __get_afterstates(self, state, actions):
+        simulation = self.env.get_simulation_from_state(state)
+        return np.stack([simulation.copy().make_move(action).board.as_numpy_array() for action in actions])
@@ -1,7 +1,14 @@
 from collections import defaultdict
 import random
 
+import numpy as np
+
 from . import ActiveAgent, agent
+from .afterstates import AfterstateTable
+from .dyna import DynaModel
+from .qtable import QTable
+from .replay import ReplayBuffer
+from exceptions import DomainException
 
 
 @agent
@@ -11,13 +18,37 @@ class QLearningAgent(ActiveAgent):
     DEFAULT_ALPHA = 0.2
     DEFAULT_EPSILON = 0.25
     DEFAULT_DISCOUNT = 0.99
+    DEFAULT_REPLAY_CAPACITY = 0
+    DEFAULT_BATCH_SIZE = 32
+    DEFAULT_PLANNING_STEPS = 0
+    DEFAULT_PLANNING_TIME = None
+    DEFAULT_AFTERSTATES = False
+
+    def __init__(
+            self,
+            alpha=DEFAULT_ALPHA,
+            epsilon=DEFAULT_EPSILON,
+            discount=DEFAULT_DISCOUNT,
+            replay_capacity=DEFAULT_REPLAY_CAPACITY,
+            batch_size=DEFAULT_BATCH_SIZE,
+            planning_steps=DEFAULT_PLANNING_STEPS,
+            planning_time=DEFAULT_PLANNING_TIME,
+            afterstates=DEFAULT_AFTERSTATES
+    ):
+        if afterstates and (replay_capacity > 0 or planning_steps > 0):
+            raise DomainException('Afterstate values can not be combined with experience replay or planning')
 
-    def __init__(self, alpha=DEFAULT_ALPHA, epsilon=DEFAULT_EPSILON, discount=DEFAULT_DISCOUNT):
         super().__init__()
         self.__base_alpha = alpha
         self.__base_epsilon = epsilon
         self.__discount = discount
-        self.__qvalues = defaultdict(_default_dict_factory)
+        self.__qvalues = None
+        self.__replay = ReplayBuffer(replay_capacity) if replay_capacity > 0 else None
+        self.__batch_size = batch_size
+        self.__model = DynaModel() if planning_steps > 0 else None
+        self.__planning_steps = planning_steps
+        self.__planning_time = planning_time
+        self.__afterstates = afterstates
 
     # ------- aux stuff ------
 
@@ -30,10 +61,10 @@ class QLearningAgent(ActiveAgent):
         return self.__base_epsilon if self.learn else 0
 
     def __get_qvalue(self, state, action):
-        return self.__qvalues[state][action]
+        return self.__qvalues.get(state, action)
 
     def __set_qvalue(self, state, action, value):
-        self.__qvalues[state][action] = value
+        self.__qvalues.set(state, action, value)
 
     def get_data_to_save(self):
         return self.__qvalues
@@ -43,6 +74,13 @@ class QLearningAgent(ActiveAgent):
 
     # ------- main stuff ------
 
+    def initialize(self):
+        super().initialize()
+        if self.__afterstates:
+            self.__qvalues = AfterstateTable.from_data(self.__qvalues, self.get_afterstates)
+        else:
+            self.__qvalues = QTable.from_data(self.__qvalues, self.size)
+
     def get_action(self, state):
         possible_actions = self.get_possible_actions(state)
 
@@ -57,37 +95,63 @@ class QLearningAgent(ActiveAgent):
             return self.__get_best_action(state)
 
     def update(self, state, action, reward, next_state):
+        if not self.learn:
+            return
+
         expr = reward + self.__discount * self.__get_value(next_state)
         new_qvalue = (1-self.__alpha) * self.__get_qvalue(state, action) + self.__alpha * expr
         self.__set_qvalue(state, action, new_qvalue)
 
+        if self.__replay is not None:
+            self.__remember(state, action, reward, next_state)
+            self.__replay_batch()
+
+        if self.__model is not None:
+            self.__observe(state, action, reward, next_state)
+            self.__model.plan(self.__planning_steps, self.__planning_time, self.__apply_batch)
+
+    def __remember(self, state, action, reward, next_state):
+        row, column = self.__qvalues.get_index(state, action)
+        self.__replay.add(
+            row=row,
+            column=column,
+            reward=np.float32(reward),
+            next_row=self.__qvalues.get_row_index(next_state),
+            next_mask=self.__qvalues.get_actions_mask(self.get_possible_actions(next_state))
+        )
+
+    def __replay_batch(self):
+        if len(self.__replay) < self.__batch_size:
+            return
+
+        self.__apply_batch(self.__replay.sample(self.__batch_size))
+
+    def __observe(self, state, action, reward, next_state):
+        row, column = self.__qvalues.get_index(state, action)
+        next_row = self.__qvalues.get_row_index(next_state)
+        next_mask = self.__qvalues.get_actions_mask(self.get_possible_actions(next_state))
+        self.__model.observe(row, column, reward, next_row, next_mask)
+
+    def __apply_batch(self, batch):
+        next_values = self.__qvalues.get_masked_max(batch['next_row'], batch['next_mask'])
+        targets = batch['reward'] + self.__discount * next_values
+        deltas = targets - self.__qvalues.get_at(batch['row'], batch['column'])
+        self.__qvalues.add_mean_at(batch['row'], batch['column'], self.__alpha * deltas)
+
     def __get_value(self, state):
         possible_actions = self.get_possible_actions(state)
-
-        if len(possible_actions) == 0:
-            return 0.0
-
-        return max([self.__get_qvalue(state, action) for action in possible_actions])
+        return self.__qvalues.get_max(state, possible_actions)
 
     def __get_best_action(self, state):
         possible_actions = self.get_possible_actions(state)
-
-        if len(possible_actions) == 0:
-            return None
-
-        qvalues = [self.__get_qvalue(state, action) for action in possible_actions]
-        best_qvalue = max(qvalues)
-        best_actions = [action for action, qvalue in zip(possible_actions, qvalues) if qvalue == best_qvalue]
-        best_action = random.choice(best_actions)
-
-        return best_action
+        return self.__qvalues.get_best_action(state, possible_actions)
 
 
-# must be standard function, not lambda, to allow pickling
+# legacy pickled data references this factory, so it must stay importable
 def _default_dict_factory():
     return defaultdict(_zero_factory)
 
 
-# must be standard function, not lambda, to allow pickling
+# legacy pickled data references this factory, so it must stay importable
 def _zero_factory():
     return 0
@@ -0,0 +1,314 @@
+import os
+import random
+import struct
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from exceptions import DomainException
+
+
+class QTable:
+    """
+    Dense table of action values used by tabular agents.
+
+    Every known state owns one float32 row with a column for every board field, rows are allocated
+    in chunks growing with the table. Reading values of unknown state does not create its row.
+
+    Table loaded from file keeps stored states as sorted keys with rows of values, possibly memory-mapped
+    and in float16, which are only read. Row of stored state is copied to growing rows when it is
+    modified or its index is needed, so row indices always refer to growing rows.
+    """
+
+    CHUNK_ROWS = 4096
+
+    def __init__(self, size):
+        self.__size = tuple(size)
+        self.__rows = {}
+        self.__values = np.zeros((0, self.__size[0] * self.__size[1]), dtype=np.float32)
+
+        self.__stored_keys = np.array([], dtype='S1')
+        self.__stored_values = np.zeros((0, self.__size[0] * self.__size[1]), dtype=np.float32)
+        self.__copied_count = 0
+
+    def __len__(self):
+        return len(self.__stored_keys) + len(self.__rows) - self.__copied_count
+
+    def __getstate__(self):
+        # state is taken from shallow copy with compacted arrays, so attributes names are mangled by Python
+        table = object.__new__(type(self))
+        table.__dict__.update(self.__dict__)
+        table.__values = self.__values[:len(self.__rows)].copy()
+        table.__stored_keys = np.array(self.__stored_keys)
+        table.__stored_values = np.array(self.__stored_values)
+        return table.__dict__
+
+    @staticmethod
+    def from_data(data, size):
+        """ Creates table from saved data, which can be table itself or legacy nested dict """
+        if isinstance(data, QTable):
+            return data
+        if data is not None and not isinstance(data, dict):
+            raise DomainException('Saved agent data holds afterstate values, not action values')
+
+        table = QTable(size)
+        for state, actions_values in (data or {}).items():
+            for action, value in actions_values.items():
+                if action is not None:
+                    table.set(state, action, value)
+        return table
+
+    @property
+    def size(self):
+        return self.__size
+
+    def states(self):
+        stored_states = (self.__decode_key(key) for key in self.__stored_keys)
+        return list(self.__rows.keys()) + [state for state in stored_states if state not in self.__rows]
+
+    def get(self, state, action):
+        values = self.__find_values(state)
+        if values is None or action is None:
+            return 0.0
+        return float(values[self.__get_column(action)])
+
+    def set(self, state, action, value):
+        row = self.__get_or_create_row(state)
+        self.__values[row, self.__get_column(action)] = value
+
+    def add(self, state, action, delta):
+        row = self.__get_or_create_row(state)
+        self.__values[row, self.__get_column(action)] += delta
+
+    def get_index(self, state, action):
+        """ Returns (row, column) of given state and action, creating row if needed """
+        return self.__get_or_create_row(state), self.__get_column(action)
+
+    def get_row_index(self, state):
+        """ Returns row of given state, creating it if needed """
+        return self.__get_or_create_row(state)
+
+    def add_at(self, rows, columns, deltas):
+        """ Adds deltas to cells given by (row, column) pairs, deltas of repeated cells accumulate """
+        np.add.at(self.__values, (rows, columns), deltas)
+
+    def add_mean_at(self, rows, columns, deltas):
+        """ Adds to every cell given by (row, column) pairs mean of its deltas, so repeated cell makes one step """
+        _, inverse, counts = np.unique(np.stack([rows, columns]), axis=1, return_inverse=True, return_counts=True)
+        self.add_at(rows, columns, deltas / counts[inverse.reshape(-1)])
+
+    def get_at(self, rows, columns):
+        return self.__values[rows, columns]
+
+    def get_actions_mask(self, actions):
+        mask = np.zeros(self.__values.shape[1], dtype=bool)
+        mask[self.__get_columns(actions)] = True
+        return mask
+
+    def get_masked_max(self, rows, masks):
+        """ Returns max value of every row among columns selected by mask, 0 for rows with empty mask """
+        values = np.where(masks, self.__values[rows], -np.inf)
+        return np.where(masks.any(axis=1), values.max(axis=1), 0)
+
+    def get_masked_mean(self, rows, masks):
+        """ Returns mean value of every row among columns selected by mask, 0 for rows with empty mask """
+        sums = np.sum(self.__values[rows] * masks, axis=1)
+        return sums / np.maximum(masks.sum(axis=1), 1)
+
+    def get_masked_argmax(self, rows, masks):
+        """ Returns column with max value of every row among columns selected by mask """
+        values = np.where(masks, self.__values[rows], -np.inf)
+        return values.argmax(axis=1)
+
+    def get_values(self, state, actions):
+        values = self.__find_values(state)
+        if values is None:
+            return np.zeros(len(actions), dtype=np.float32)
+        return values[self.__get_columns(actions)].astype(np.float32)
+
+    def get_max(self, state, actions):
+        if len(actions) == 0:
+            return 0.0
+        return float(np.max(self.get_values(state, actions)))
+
+    def get_best_action(self, state, actions):
+        """ Returns random action from actions with the highest value """
+        if len(actions) == 0:
+            return None
+        return self.choose_best_action(actions, self.get_values(state, actions))
+
+    @staticmethod
+    def choose_best_action(actions, values):
+        best_indices = np.flatnonzero(values == np.max(values))
+        return actions[random.choice(best_indices)]
+
+    def get_sorted_arrays(self):
+        """ Returns sorted keys of all states and their rows of values """
+        keys = np.array([self.__encode_key(state) for state in self.__rows.keys()],
+                        dtype=f'S{self.__get_key_width(self.__size)}')
+        values = self.__values[:len(self.__rows)]
+
+        not_copied = ~np.isin(self.__stored_keys, keys)
+        keys = np.concatenate([self.__stored_keys[not_copied].astype(keys.dtype), keys])
+        values = np.concatenate([self.__stored_values[not_copied].astype(np.float32), values])
+        order = np.argsort(keys, kind='stable')
+        return keys[order], values[order]
+
+    @staticmethod
+    def from_sorted_arrays(size, keys, values):
+        """ Creates table reading stored states from given sorted keys and rows of values """
+        table = QTable(size)
+        table.__stored_keys = keys
+        table.__stored_values = values
+        return table
+
+    def __find_values(self, state):
+        """ Returns row of values of given state or None when state is not known """
+        row = self.__rows.get(state)
+        if row is not None:
+            return self.__values[row]
+
+        stored_row = self.__find_stored_row(state)
+        if stored_row is not None:
+            return self.__stored_values[stored_row]
+        return None
+
+    def __find_stored_row(self, state):
+        if len(self.__stored_keys) == 0:
+            return None
+        key = self.__encode_key(state)
+        index = np.searchsorted(self.__stored_keys, key)
+        if index < len(self.__stored_keys) and self.__stored_keys[index] == key:
+            return index
+        return None
+
+    def __get_or_create_row(self, state):
+        row = self.__rows.get(state)
+        if row is None:
+            row = len(self.__rows)
+            if row >= len(self.__values):
+                self.__grow()
+            self.__rows[state] = row
+
+            stored_row = self.__find_stored_row(state)
+            if stored_row is not None:
+                self.__values[row] = self.__stored_values[stored_row]
+                self.__copied_count += 1
+        return row
+
+    def __grow(self):
+        chunk_rows = max(self.CHUNK_ROWS, len(self.__values) // 2)
+        chunk = np.zeros((chunk_rows, self.__values.shape[1]), dtype=np.float32)
+        self.__values = np.concatenate([self.__values, chunk])
+
+    def __get_column(self, action):
+        return action[0] * self.__size[1] + action[1]
+
+    def __get_columns(self, actions):
+        width = self.__size[1]
+        return [y * width + x for y, x in actions]
+
+    @staticmethod
+    def __get_key_width(size):
+        # state holds 2 bits for every field
+        return max((2 * size[0] * size[1] + 7) // 8, 1)
+
+    @staticmethod
+    def __encode_key(state):
+        # little-endian bytes without trailing zeros, which numpy pads with zeros to the width of keys array
+        return state.to_bytes(max((state.bit_length() + 7) // 8, 1), 'little').rstrip(b'\x00')
+
+    @staticmethod
+    def __decode_key(key):
+        return int.from_bytes(bytes(key), 'little')
+
+
+class QTablesFile:
+    """
+    Binary file with Q-tables of one agent.
+
+    File starts with header holding board size, number of tables and size of values, then every table is
+    stored as number of states, sorted keys of states and rows of values, float32 or float16. Tables are
+    memory-mapped when opened only to play, so their data is not read into memory until it is needed.
+    File is written to temporary file first and renamed, so it is always complete, also when it is saved
+    periodically in background thread.
+    """
+
+    SUFFIX = '.qtable'
+    MAGIC = b'QVALUES_'
+    VERSION = 1
+
+    __HEADER = struct.Struct('<8sHBBBB')     # magic, version, height, width, tables count, values item size
+    __TABLE_HEADER = struct.Struct('<QH')     # states count, key width
+
+    def __init__(self, path, half_precision=False):
+        self.path = Path(path).with_suffix(self.SUFFIX)
+        self.__dtype = np.dtype('<f2' if half_precision else '<f4')
+        self.__writing = None
+
+    def exists(self):
+        return self.path.exists()
+
+    def load(self, mmap=True):
+        """ Returns list of tables stored in file """
+        with open(self.path, 'rb') as f:
+            header = f.read(self.__HEADER.size)
+            if len(header) < self.__HEADER.size:
+                raise DomainException(f'File {self.path} is not a Q-tables file')
+            magic, version, height, width, tables_count, item_size = self.__HEADER.unpack(header)
+            if magic != self.MAGIC or version != self.VERSION:
+                raise DomainException(f'File {self.path} is not a Q-tables file')
+
+            offset = self.__HEADER.size
+            tables = []
+            for _ in range(tables_count):
+                f.seek(offset)
+                count, key_width = self.__TABLE_HEADER.unpack(f.read(self.__TABLE_HEADER.size))
+                keys_offset = offset + self.__TABLE_HEADER.size
+                values_offset = keys_offset + count * key_width
+                values_offset += -values_offset % item_size
+                offset = values_offset + count * height * width * item_size
+
+                keys = self.__read_array(f'S{key_width}', keys_offset, (count,), mmap)
+                values = self.__read_array(f'<f{item_size}', values_offset, (count, height * width), mmap)
+                tables.append(QTable.from_sorted_arrays((height, width), keys, values))
+        return tables
+
+    def save(self, tables):
+        self.wait()
+        self.__write([table.get_sorted_arrays() for table in tables], tables[0].size)
+
+    def save_in_background(self, tables):
+        """ Takes snapshot of tables and writes it in background thread, after previous writing finished """
+        self.wait()
+        snapshot = [table.get_sorted_arrays() for table in tables]
+        self.__writing = threading.Thread(target=self.__write, args=(snapshot, tables[0].size))
+        self.__writing.start()
+
+    def wait(self):
+        if self.__writing is not None:
+            self.__writing.join()
+            self.__writing = None
+
+    def __write(self, arrays, size):
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(self.__HEADER.pack(self.MAGIC, self.VERSION, *size, len(arrays), self.__dtype.itemsize))
+            for keys, values in arrays:
+                f.write(self.__TABLE_HEADER.pack(len(keys), keys.itemsize))
+                f.write(keys.tobytes())
+                f.write(bytes(-f.tell() % self.__dtype.itemsize))
+                f.write(values.astype(self.__dtype).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def __read_array(self, dtype, offset, shape, mmap):
+        if shape[0] == 0:
+            return np.zeros(shape, dtype=dtype)
+        if mmap:
+            return np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=shape)
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
@@ -0,0 +1,49 @@
+import numpy as np
+
+
+class ReplayBuffer:
+    """
+    Fixed capacity ring buffer of transitions.
+
+    Every transition is a set of named fields, arrays for fields are allocated on first added transition
+    using its shapes and types, and the oldest transitions are overwritten when the buffer is full.
+    """
+
+    def __init__(self, capacity):
+        self.__capacity = capacity
+        self.__arrays = None
+        self.__next_index = 0
+        self.__count = 0
+
+    def __len__(self):
+        return self.__count
+
+    @property
+    def capacity(self):
+        return self.__capacity
+
+    def add(self, **fields):
+        if self.__arrays is None:
+            self.__arrays = self.__allocate(fields)
+
+        for name, value in fields.items():
+            self.__arrays[name][self.__next_index] = value
+
+        self.__next_index = (self.__next_index + 1) % self.__capacity
+        self.__count = min(self.__count + 1, self.__capacity)
+
+    def sample(self, batch_size):
+        """ Returns dict of arrays with batch_size random transitions """
+        indices = np.random.randint(0, self.__count, size=batch_size)
+        return {name: array[indices] for name, array in self.__arrays.items()}
+
+    def clear(self):
+        self.__next_index = 0
+        self.__count = 0
+
+    def __allocate(self, fields):
+        arrays = {}
+        for name, value in fields.items():
+            value = np.asarray(value)
+            arrays[name] = np.zeros((self.__capacity, *value.shape), dtype=value.dtype)
+        return arrays
@@ -2,6 +2,10 @@ from collections import defaultdict
 import random
 
 from . import ActiveAgent, agent
+from .afterstates import AfterstateTable
+from .dyna import DynaModel
+from .qtable import QTable
+from exceptions import DomainException
 
 
 @agent
@@ -11,14 +15,32 @@ class SarsaAgent(ActiveAgent):
     DEFAULT_ALPHA = 0.2
     DEFAULT_EPSILON = 0.25
     DEFAULT_DISCOUNT = 0.99
+    DEFAULT_PLANNING_STEPS = 0
+    DEFAULT_PLANNING_TIME = None
+    DEFAULT_AFTERSTATES = False
+
+    def __init__(
+            self,
+            alpha=DEFAULT_ALPHA,
+            epsilon=DEFAULT_EPSILON,
+            discount=DEFAULT_DISCOUNT,
+            planning_steps=DEFAULT_PLANNING_STEPS,
+            planning_time=DEFAULT_PLANNING_TIME,
+            afterstates=DEFAULT_AFTERSTATES
+    ):
+        if afterstates and (planning_steps > 0):
+            raise DomainException('Afterstate values can not be combined with planning')
 
-    def __init__(self, alpha=DEFAULT_ALPHA, epsilon=DEFAULT_EPSILON, discount=DEFAULT_DISCOUNT):
         super().__init__()
         self.__base_alpha = alpha
         self.__base_epsilon = epsilon
         self.__discount = discount
         self.__planned_action = None
-        self._qvalues = defaultdict(_default_dict_factory)
+        self._qvalues = None
+        self.__model = DynaModel() if planning_steps > 0 else None
+        self.__planning_steps = planning_steps
+        self.__planning_time = planning_time
+        self.__afterstates = afterstates
 
     # ------- aux stuff ------
 
@@ -31,10 +53,10 @@ class SarsaAgent(ActiveAgent):
         return self.__base_epsilon if self.learn else 0
 
     def _get_qvalue(self, state, action):
-        return self._qvalues[state][action]
+        return self._qvalues.get(state, action)
 
     def _set_qvalue(self, state, action, value):
-        self._qvalues[state][action] = value
+        self._qvalues.set(state, action, value)
 
     def get_data_to_save(self):
         return self._qvalues
@@ -44,6 +66,13 @@ class SarsaAgent(ActiveAgent):
 
     # ------- main stuff ------
 
+    def initialize(self):
+        super().initialize()
+        if self.__afterstates:
+            self._qvalues = AfterstateTable.from_data(self._qvalues, self.get_afterstates)
+        else:
+            self._qvalues = QTable.from_data(self._qvalues, self.size)
+
     def before_gameplay(self):
         self.__planned_action = None
 
@@ -55,18 +84,34 @@ class SarsaAgent(ActiveAgent):
 
     def update(self, state, action, reward, next_state):
         self.__planned_action = self._get_new_action(next_state)
+        if not self.learn:
+            return
 
         expr = reward + self.__discount * self._get_value(next_state)
         new_qvalue = (1 - self._alpha) * self._get_qvalue(state, action) + self._alpha * expr
         self._set_qvalue(state, action, new_qvalue)
 
-    def _get_value(self, state):
-        possible_actions = self.get_possible_actions(state)
+        if self.__model is not None:
+            self.__observe(state, action, reward, next_state)
+            self.__model.plan(self.__planning_steps, self.__planning_time, self.__apply_planning_batch)
 
-        if len(possible_actions) == 0:
-            return 0.0
+    def __observe(self, state, action, reward, next_state):
+        row, column = self._qvalues.get_index(state, action)
+        next_row = self._qvalues.get_row_index(next_state)
+        next_mask = self._qvalues.get_actions_mask(self.get_possible_actions(next_state))
+        self.__model.observe(row, column, reward, next_row, next_mask)
+
+    def __apply_planning_batch(self, batch):
+        targets = batch['reward'] + self.__discount * self._get_batch_values(batch['next_row'], batch['next_mask'])
+        deltas = targets - self._qvalues.get_at(batch['row'], batch['column'])
+        self._qvalues.add_mean_at(batch['row'], batch['column'], self._alpha * deltas)
+
+    def _get_batch_values(self, rows, masks):
+        return self._qvalues.get_masked_max(rows, masks)
 
-        return max([self._get_qvalue(state, action) for action in possible_actions])
+    def _get_value(self, state):
+        possible_actions = self.get_possible_actions(state)
+        return self._qvalues.get_max(state, possible_actions)
 
     def _get_new_action(self, state):
         possible_actions = self.get_possible_actions(state)
@@ -83,23 +128,14 @@ class SarsaAgent(ActiveAgent):
 
     def _get_best_action(self, state):
         possible_actions = self.get_possible_actions(state)
-
-        if len(possible_actions) == 0:
-            return None
-
-        qvalues = [self._get_qvalue(state, action) for action in possible_actions]
-        best_qvalue = max(qvalues)
-        best_actions = [action for action, qvalue in zip(possible_actions, qvalues) if qvalue == best_qvalue]
-        best_action = random.choice(best_actions)
-
-        return best_action
+        return self._qvalues.get_best_action(state, possible_actions)
 
 
-# must be standard function, not lambda, to allow pickling
+# legacy pickled data references this factory, so it must stay importable
 def _default_dict_factory():
     return defaultdict(_zero_factory)
 
 
-# must be standard function, not lambda, to allow pickling
+# legacy pickled data references this factory, so it must stay importable
 def _zero_factory():
     return 0
@@ -2,6 +2,8 @@ from collections import defaultdict
 import random
 
 from . import ActiveAgent, agent
+from .qtable import QTable
+from .traces import EligibilityTraces
 
 
 @agent
@@ -12,13 +14,17 @@ class SarsaLambdaAgent(ActiveAgent):
     DEFAULT_EPSILON = 0.25
     DEFAULT_DISCOUNT = 0.99
     DEFAULT_LAMBDA = 0.5
+    DEFAULT_TRACE_THRESHOLD = EligibilityTraces.DEFAULT_THRESHOLD
+    DEFAULT_REPLACING_TRACES = False
 
     def __init__(
             self,
             alpha=DEFAULT_ALPHA,
             epsilon=DEFAULT_EPSILON,
             discount=DEFAULT_DISCOUNT,
-            lambda_value=DEFAULT_LAMBDA
+            lambda_value=DEFAULT_LAMBDA,
+            trace_threshold=DEFAULT_TRACE_THRESHOLD,
+            replacing_traces=DEFAULT_REPLACING_TRACES
     ):
         super().__init__()
         self.__base_alpha = alpha
@@ -26,11 +32,10 @@ class SarsaLambdaAgent(ActiveAgent):
         self.__discount = discount
         self.__lambda_value = lambda_value
 
-        self._qvalues = defaultdict(_default_dict_factory)
-        self._evalues = defaultdict(_default_dict_factory)
+        self._qvalues = None
+        self._traces = EligibilityTraces(trace_threshold, replacing_traces)
 
         self.__planned_action = None
-        self.__visited_state_actions = []
 
     # ------- aux stuff ------
 
@@ -43,16 +48,10 @@ class SarsaLambdaAgent(ActiveAgent):
         return self.__base_epsilon if self.learn else 0
 
     def _get_qvalue(self, state, action):
-        return self._qvalues[state][action]
+        return self._qvalues.get(state, action)
 
     def _set_qvalue(self, state, action, value):
-        self._qvalues[state][action] = value
-
-    def _get_evalue(self, state, action):
-        return self._evalues[state][action]
-
-    def _set_evalue(self, state, action, value):
-        self._evalues[state][action] = value
+        self._qvalues.set(state, action, value)
 
     def get_data_to_save(self):
         return self._qvalues
@@ -62,10 +61,13 @@ class SarsaLambdaAgent(ActiveAgent):
 
     # ------- main stuff ------
 
+    def initialize(self):
+        super().initialize()
+        self._qvalues = QTable.from_data(self._qvalues, self.size)
+
     def before_gameplay(self):
-        self._evalues = defaultdict(_default_dict_factory)
+        self._traces.clear()
         self.__planned_action = None
-        self.__visited_state_actions = []
 
     def get_action(self, state):
         if self.__planned_action is None:
@@ -75,6 +77,8 @@ class SarsaLambdaAgent(ActiveAgent):
 
     def update(self, state, action, reward, next_state):
         self.__planned_action = self._get_new_action(next_state)
+        if not self.learn:
+            return
 
         delta = reward + self.__discount * self._get_qvalue(next_state, self.__planned_action) - self._get_qvalue(state, action)
         self._update_current_state_action_trace(state, action)
@@ -82,11 +86,7 @@ class SarsaLambdaAgent(ActiveAgent):
 
     def _get_value(self, state):
         possible_actions = self.get_possible_actions(state)
-
-        if len(possible_actions) == 0:
-            return 0.0
-
-        return max([self._get_qvalue(state, action) for action in possible_actions])
+        return self._qvalues.get_max(state, possible_actions)
 
     def _get_new_action(self, state):
         possible_actions = self.get_possible_actions(state)
@@ -103,39 +103,21 @@ class SarsaLambdaAgent(ActiveAgent):
 
     def _get_best_action(self, state):
         possible_actions = self.get_possible_actions(state)
-
-        if len(possible_actions) == 0:
-            return None
-
-        qvalues = [self._get_qvalue(state, action) for action in possible_actions]
-        best_qvalue = max(qvalues)
-        best_actions = [action for action, qvalue in zip(possible_actions, qvalues) if qvalue == best_qvalue]
-        best_action = random.choice(best_actions)
-
-        return best_action
+        return self._qvalues.get_best_action(state, possible_actions)
 
     def _update_current_state_action_trace(self, state, action):
-        current_value = self._get_evalue(state, action)
-        new_value = current_value + 1
-        self._set_evalue(state, action, new_value)
-        self.__visited_state_actions.append((state, action))
+        self._traces.visit(*self._qvalues.get_index(state, action))
 
     def _update_past_state_actions(self, delta):
-        for state, action in self.__visited_state_actions:
-            e_value = self._get_evalue(state, action)
-            q_value = self._get_qvalue(state, action)
-            new_qvalue = q_value + self._alpha * delta * e_value
-            new_evalue = self.__discount * self._alpha * e_value
-
-            self._set_qvalue(state, action, new_qvalue)
-            self._set_evalue(state, action, new_evalue)
+        self._traces.apply(self._qvalues, self._alpha * delta)
+        self._traces.decay(self.__discount * self.__lambda_value)
 
 
-# must be standard function, not lambda, to allow pickling
+# legacy pickled data references this factory, so it must stay importable
 def _default_dict_factory():
     return defaultdict(_zero_factory)
 
 
-# must be standard function, not lambda, to allow pickling
+# legacy pickled data references this factory, so it must stay importable
 def _zero_factory():
     return 0
@@ -0,0 +1,70 @@
+import numpy as np
+
+
+class EligibilityTraces:
+    """
+    Sparse eligibility traces of (row, column) cells of QTable.
+
+    Every cell is stored once, traces which decayed below threshold are dropped, so only recently visited
+    cells are updated. Replacing traces reset the trace of visited cell to 1 instead of incrementing it.
+    """
+
+    DEFAULT_THRESHOLD = 1e-4
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, replacing=False):
+        self.__threshold = threshold
+        self.__replacing = replacing
+        self.__slots = {}
+        self.__rows = np.zeros(self.INITIAL_CAPACITY, dtype=np.int64)
+        self.__columns = np.zeros(self.INITIAL_CAPACITY, dtype=np.int64)
+        self.__values = np.zeros(self.INITIAL_CAPACITY, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.__slots)
+
+    def clear(self):
+        self.__slots = {}
+
+    def visit(self, row, column):
+        slot = self.__slots.get((row, column))
+
+        if slot is not None:
+            self.__values[slot] = 1 if self.__replacing else self.__values[slot] + 1
+            return
+
+        slot = len(self.__slots)
+        if slot >= len(self.__values):
+            self.__grow()
+        self.__slots[(row, column)] = slot
+        self.__rows[slot] = row
+        self.__columns[slot] = column
+        self.__values[slot] = 1
+
+    def apply(self, qtable, step):
+        """ Adds step multiplied by trace to every traced cell of qtable """
+        count = len(self.__slots)
+        qtable.add_at(self.__rows[:count], self.__columns[:count], step * self.__values[:count])
+
+    def decay(self, factor):
+        count = len(self.__slots)
+        values = self.__values[:count]
+        values *= factor
+
+        alive = values >= self.__threshold
+        if alive.all():
+            return
+
+        alive_count = np.count_nonzero(alive)
+        self.__rows[:alive_count] = self.__rows[:count][alive]
+        self.__columns[:alive_count] = self.__columns[:count][alive]
+        self.__values[:alive_count] = values[alive]
+        self.__slots = {
+            (int(row), int(column)): slot
+            for slot, (row, column) in enumerate(zip(self.__rows[:alive_count], self.__columns[:alive_count]))
+        }
+
+    def __grow(self):
+        self.__rows = np.concatenate([self.__rows, np.zeros_like(self.__rows)])
+        self.__columns = np.concatenate([self.__columns, np.zeros_like(self.__columns)])
+        self.__values = np.concatenate([self.__values, np.zeros_like(self.__values)])
@@ -3,7 +3,9 @@ import random
 import numpy as np
 
 from . import PassiveAgent, agent
-from board import Side
+from .cache import LruCache
+from .features import BoardFeatures
+from .replay import ReplayBuffer
 
 
 @agent
@@ -12,13 +14,28 @@ class ValueApproximationAgent(PassiveAgent):
     DEFAULT_ALPHA = 0.2
     DEFAULT_EPSILON = 0.25
     DEFAULT_DISCOUNT = 0.99
-
-    def __init__(self, alpha=DEFAULT_ALPHA, epsilon=DEFAULT_EPSILON, discount=DEFAULT_DISCOUNT):
+    DEFAULT_REPLAY_CAPACITY = 0
+    DEFAULT_BATCH_SIZE = 32
+    DEFAULT_CACHE_SIZE = 100000
+
+    def __init__(
+            self,
+            alpha=DEFAULT_ALPHA,
+            epsilon=DEFAULT_EPSILON,
+            discount=DEFAULT_DISCOUNT,
+            replay_capacity=DEFAULT_REPLAY_CAPACITY,
+            batch_size=DEFAULT_BATCH_SIZE,
+            cache_size=DEFAULT_CACHE_SIZE
+    ):
         super().__init__()
         self.__base_alpha = alpha
         self.__base_epsilon = epsilon
         self.__discount = discount
         self.__weights = None
+        self.__replay = ReplayBuffer(replay_capacity) if replay_capacity > 0 else None
+        self.__batch_size = batch_size
+        self.__features_cache = LruCache(cache_size)
+        self.__values_cache = LruCache(cache_size)
 
     # ------- aux stuff ------
 
@@ -35,6 +52,12 @@ class ValueApproximationAgent(PassiveAgent):
 
     def set_saved_data(self, data):
         self.__weights = data
+        self.__values_cache.clear()
+
+    @property
+    def cache_stats(self):
+        """ Returns statistics of afterstates features and values caches """
+        return {'features': self.__features_cache.get_stats(), 'values': self.__values_cache.get_stats()}
 
     # ------- main stuff ------
 
@@ -51,6 +74,33 @@ class ValueApproximationAgent(PassiveAgent):
         else:
             return self.__get_best_action(state)
 
+    def get_actions(self, states):
+        actions = [None] * len(states)
+        greedy_states, greedy_actions, afterstates = [], [], []
+
+        for i, state in enumerate(states):
+            possible_actions = self.env.get_possible_actions(state)
+            if len(possible_actions) == 0:
+                continue
+            if random.random() < self.__epsilon or self.__weights is None:
+                actions[i] = random.choice(possible_actions)
+            else:
+                greedy_states.append(i)
+                greedy_actions.append(possible_actions)
+                afterstates.extend(self.__get_afterstates(state, possible_actions))
+
+        # values of afterstates of all states come from one matrix-vector product
+        values = self.__get_boards_values(afterstates) if afterstates else []
+        offset = 0
+        for i, possible_actions in zip(greedy_states, greedy_actions):
+            actions_values = values[offset:offset + len(possible_actions)]
+            best_value = max(actions_values)
+            best_actions = [a for a, value in zip(possible_actions, actions_values) if value == best_value]
+            actions[i] = random.choice(best_actions)
+            offset += len(possible_actions)
+
+        return actions
+
     def update(self, state, action, reward, next_state):
         if not self.learn:
             return
@@ -60,16 +110,43 @@ class ValueApproximationAgent(PassiveAgent):
         if self.__weights is None:
             self.__weights = np.random.random((len(features),))
 
-        delta = (reward + self.__discount * self.__get_value(next_state)) - self.__get_qvalue(state, action)
+        delta = (reward + self.__discount * self.__get_value(next_state)) - self.__weights @ features
         self.__weights += self.__alpha * delta * features
 
+        if self.__replay is not None:
+            self.__remember(features, reward, next_state)
+            self.__replay_batch()
+
+    def __remember(self, features, reward, next_state):
+        next_actions = self.env.get_possible_actions(next_state)
+        next_features = np.zeros((np.prod(self.env.size), len(features)), dtype=np.float32)
+        if len(next_actions) > 0:
+            next_features[:len(next_actions)] = self.__get_actions_features(next_state, next_actions)
+
+        self.__replay.add(
+            features=features.astype(np.float32),
+            reward=np.float32(reward),
+            next_features=next_features,
+            next_mask=np.arange(len(next_features)) < len(next_actions)
+        )
+
+    def __replay_batch(self):
+        if len(self.__replay) < self.__batch_size:
+            return
+
+        batch = self.__replay.sample(self.__batch_size)
+        next_qvalues = np.where(batch['next_mask'], batch['next_features'] @ self.__weights, -np.inf)
+        next_values = np.where(batch['next_mask'].any(axis=1), next_qvalues.max(axis=1), 0)
+        deltas = batch['reward'] + self.__discount * next_values - batch['features'] @ self.__weights
+        self.__weights += self.__alpha * (deltas @ batch['features']) / self.__batch_size
+
     def __get_best_action(self, state):
         possible_actions = self.env.get_possible_actions(state)
 
         if len(possible_actions) == 0:
             return None
 
-        qvalues = [self.__get_qvalue(state, action) for action in possible_actions]
+        qvalues = self.__get_qvalues(state, possible_actions)
         best_qvalue = max(qvalues)
         best_actions = [action for action, qvalue in zip(possible_actions, qvalues) if qvalue == best_qvalue]
         best_action = random.choice(best_actions)
@@ -81,78 +158,55 @@ class ValueApproximationAgent(PassiveAgent):
         if len(possible_actions) == 0:
             return 0.0
 
-        return max([self.__get_qvalue(state, action) for action in possible_actions])
+        return np.max(self.__get_qvalues(state, possible_actions))
 
-    def __get_qvalue(self, state, action):
-        features = self.__get_features(state, action)
-        return self.__weights @ features if self.__weights is not None else 0
+    def __get_qvalues(self, state, actions):
+        if self.__weights is None:
+            return np.zeros(len(actions))
+        return self.__get_boards_values(self.__get_afterstates(state, actions))
+
+    def get_board_value(self, board):
+        """ Returns approximated value of board just after move of Side.ME """
+        return self.__get_boards_values([board])[0] if self.__weights is not None else 0
 
     def __get_features(self, state, action):
+        return self.__get_actions_features(state, [action])[0]
+
+    def __get_actions_features(self, state, actions):
+        """ Returns (actions, features) matrix of boards after every action """
+        return self.__get_boards_features(self.__get_afterstates(state, actions))
+
+    def __get_afterstates(self, state, actions):
         simulation = self.env.get_simulation_from_state(state)
-        simulation.make_move(action)
-        board = simulation.board
-
-        my_features = self.__get_features_for_side(board, Side.ME)
-        op_features = self.__get_features_for_side(board, Side.OPPONENT)
-        features = [*my_features, *op_features]
-        return np.array(features)
-
-    def __get_features_for_side(self, board, side):
-        fields_count = np.prod(board.size)
-        moves_count = len(board.get_legal_moves(side)) / fields_count
-        discs_count = board.get_discs_count(side) / fields_count
-        corners_count = self.__get_corner_discs_count(board, side) / fields_count
-        edges_count = self.__get_edge_discs_count(board, side) / fields_count
-        diagonal_count = self.__get_diagonal_discs_count(board, side) / fields_count
-        rings_densities = self.__get_discs_densities_in_rings(board, side)
-        return [moves_count, discs_count, corners_count, edges_count, diagonal_count, *rings_densities]
-
-    @staticmethod
-    def __get_corner_discs_count(board, side):
-        board_array = board.as_numpy_array()
-        corners_ix = np.ix_((0, -1), (0, -1))
-        corners = board_array[corners_ix]
-        return np.sum(corners == side)
-
-    @staticmethod
-    def __get_edge_discs_count(board, side):
-        board_array = board.as_numpy_array()
-        h_edges = board_array[1:-1, (0, -1)]
-        v_edges = board_array[(0, -1), 1:-1]
-        edges = np.concatenate([h_edges.flatten(), v_edges.flatten()])
-        return np.sum(edges == side)
-
-    @staticmethod
-    def __get_diagonal_discs_count(board, side):
-        diagonal_count = 0
-
-        board_array = board.as_numpy_array()
-        while board_array.shape[0] >= 2 and board_array.shape[1] >= 2:
-            edges = board_array[np.ix_((0, -1), (0, -1))]
-            count = np.sum(edges == side)
-            diagonal_count += count
-            board_array = board_array[1:-1, 1:-1]
-
-        return diagonal_count
-
-    @staticmethod
-    def __get_discs_densities_in_rings(board, side):
-        densities = []
-
-        board_array = board.as_numpy_array()
-        while board_array.shape[0] >= 2 and board_array.shape[1] >= 2:
-            max_count_in_ring = 4 + 2 * (board_array.shape[0] - 2) + 2 * (board_array.shape[1] - 2)
-            count_before = np.sum(board_array == side)
-            board_array = board_array[1:-1, 1:-1]
-            count_after = np.sum(board_array == side)
-            count_in_ring = count_before - count_after
-            density = count_in_ring / max_count_in_ring
-            densities.append(density)
-
-        if board_array.size > 0:
-            max_count = np.prod(board_array.shape)
-            count = np.sum(board_array == side)
-            density = count / max_count
-            densities.append(density)
-
-        return densities
+        return [simulation.copy().make_move(action).board for action in actions]
+
+    def __get_boards_values(self, boards):
+        numbers = [board.number for board in boards]
+        # weights of learning agent change after every move, so only values of not learning agent are cached
+        if self.learn:
+            return self.__get_boards_features(boards, numbers) @ self.__weights
+
+        cached = [self.__values_cache.get(number) for number in numbers]
+        missing = [i for i, value in enumerate(cached) if value is None]
+
+        if missing:
+            features = self.__get_boards_features([boards[i] for i in missing], [numbers[i] for i in missing])
+            for i, value in zip(missing, features @ self.__weights):
+                cached[i] = value
+                self.__values_cache.put(numbers[i], value)
+
+        return np.array(cached)
+
+    def __get_boards_features(self, boards, numbers=None):
+        numbers = numbers or [board.number for board in boards]
+        cached = [self.__features_cache.get(number) for number in numbers]
+        missing = [i for i, features in enumerate(cached) if features is None]
+
+        if missing:
+            missing_boards = np.stack([boards[i].as_numpy_array() for i in missing])
+            computed = BoardFeatures.for_size(boards[0].size).get_features(missing_boards)
+            for i, features in zip(missing, computed):
+                cached[i] = features
+                self.__features_cache.put(numbers[i], features)
+
+        return np.stack(cached)
@@ -76,6 +76,9 @@ class LiveBackend(Backend):
 
 class PreparedBackend(Backend):
 
+    # all positions of bigger boards can not be enumerated in reasonable time
+    MAX_PRACTICAL_FIELDS = 16
+
     def __init__(self, size, path):
         super().__init__(size)
         self.__path = path
@@ -0,0 +1,256 @@
+from contextlib import redirect_stdout
+from pathlib import Path
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
+
+import click
+
+from agents import agents
+from gameplay import NoGuiGameplay
+from simulation import Simulation
+from backend import LiveBackend, PreparedBackend
+from exceptions import DomainException
+
+
+DEFAULT_SIZES = [(4, 4), (6, 6), (8, 8)]
+# agents searching until deadline make fixed number of search iterations per decision instead
+AGENTS_PARAMS = {
+    'mcts': {'iterations': 10},
+    'mcts_value': {'iterations': 10},
+}
+STARTUP_COMMANDS = {
+    'help': ['--help'],
+    'nogui_game': ['random', 'random', '-s', '4', '4', '-n', '1', '--nogui'],
+}
+
+
+@click.command(help="Measures speed of backends, agents and training and compares it with baseline")
+@click.option('-s', '--size', 'sizes', nargs=2, type=int, multiple=True, help='Size of the map, can be repeated')
+@click.option('-t', '--duration', type=float, default=2.0, help='Duration of every throughput measurement in s')
+@click.option('-o', '--output', type=click.Path(dir_okay=False), default=None, help='JSON file to write results to')
+@click.option('-b', '--baseline', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='JSON file with results to compare with')
+@click.option('--tolerance', type=float, default=0.1, help='Relative slowdown reported as regression')
+@click.option('--prepared/--no-prepared', default=True, help='Whether run slow prepared backend benchmarks')
+def benchmark(sizes, duration, output, baseline, tolerance, prepared):
+    results = run_startup_benchmarks()
+    for size in sizes or DEFAULT_SIZES:
+        results.update(run_benchmarks(tuple(size), duration, prepared))
+
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if baseline is None:
+        print_results(results)
+        return
+
+    with open(baseline) as f:
+        regressions = compare_results(results, json.load(f), tolerance)
+    if regressions:
+        raise DomainException(f'{len(regressions)} benchmarks regressed: {", ".join(regressions)}')
+
+
+def run_benchmarks(size, duration, prepared):
+    prefix = f'{size[0]}x{size[1]}'
+    results = {}
+
+    def add(name, value, unit, higher_is_better=True):
+        results[f'{prefix}/{name}'] = {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+        print(f'  {prefix}/{name}: {value:.2f} {unit}', file=sys.stderr)
+
+    live_backend = LiveBackend(size)
+    add('live/moves', measure_moves(live_backend, size, duration), 'moves/s')
+
+    prepared_backend = None
+    learned_agents = {}
+    if prepared and size[0] * size[1] <= PreparedBackend.MAX_PRACTICAL_FIELDS:
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'data.pickle'
+            build_time, _ = measure_time(lambda: PreparedBackend(size, path))
+            load_time, prepared_backend = measure_time(lambda: PreparedBackend(size, path))
+        add('prepared/build', build_time, 's', higher_is_better=False)
+        add('prepared/load', load_time, 's', higher_is_better=False)
+        add('prepared/moves', measure_moves(prepared_backend, size, duration), 'moves/s')
+
+        agent = agents['value_iter']()
+        gameplay = NoGuiGameplay(size, 0, prepared_backend)
+        sweep_time, _ = measure_time(lambda: gameplay.set_players(agent, agents['random']()))
+        add('value_iter/learning', sweep_time, 's', higher_is_better=False)
+        learned_agents['value_iter'] = agent
+
+    backend = prepared_backend or live_backend
+    for name, agent_class in agents.items():
+        if agent_class is None:
+            continue
+        agent = learned_agents.get(name) or agent_class(**AGENTS_PARAMS.get(name, {}))
+        decisions = measure_decisions(agent, size, backend, duration)
+        if decisions is not None:
+            add(f'{name}/decisions', decisions, 'decisions/s')
+
+    add('selfplay/games', measure_selfplay(size, backend, duration), 'games/s')
+    return results
+
+
+def run_startup_benchmarks(runs=5):
+    results = {}
+    for name, arguments in STARTUP_COMMANDS.items():
+        value = measure_startup(arguments, runs)
+        results[f'startup/{name}'] = {'value': value, 'unit': 's', 'higher_is_better': False}
+        print(f'  startup/{name}: {value:.3f} s', file=sys.stderr)
+    return results
+
+
+def measure_startup(arguments, runs):
+    """ Returns median wall time of running reversi.py with given arguments in new interpreter """
+    script = Path(__file__).parent / 'reversi.py'
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, str(script), *arguments], stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def measure_time(function):
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = function()
+        return time.perf_counter() - start, result
+
+
+def measure_moves(backend, size, duration):
+    """ Plays random games and returns number of moves made per second """
+    moves_count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        simulation = Simulation.create_initial(size, backend)
+        while not simulation.is_finished():
+            simulation.make_move(random.choice(simulation.get_moves()))
+            moves_count += 1
+    return moves_count / (time.perf_counter() - start)
+
+
+def measure_decisions(agent, size, backend, duration):
+    """
+    Plays not learning agent against random one and returns number of its decisions per second.
+
+    Time of update is counted too, as some agents, e.g. sarsa, choose their next action there.
+    """
+    agent.learn = False
+
+    gameplay = NoGuiGameplay(size, 0, backend)
+    try:
+        with redirect_stdout(io.StringIO()):
+            gameplay.set_players(agent, agents['random']())
+    except DomainException as e:
+        print(f'  skipping {agent.NAME}: {e.message}', file=sys.stderr)
+        return None
+
+    # slow agents may not finish single game in given time, so measurement stops in the middle of game
+    decisions = DecisionsCounter(agent, time.perf_counter() + duration)
+    try:
+        while True:
+            gameplay.play()
+            gameplay.reset()
+            gameplay.swap_players()
+    except TimeIsUp:
+        pass
+
+    if decisions.count == 0:
+        print(f'  skipping {agent.NAME}: no decision was made in {duration} s', file=sys.stderr)
+        return None
+    return decisions.count / decisions.time
+
+
+class TimeIsUp(Exception):
+    pass
+
+
+def measure_selfplay(size, backend, duration):
+    """ Returns number of games per second played by two learning q_learning agents """
+    gameplay = NoGuiGameplay(size, 0, backend)
+    gameplay.set_players(agents['q_learning'](), agents['q_learning']())
+
+    games_count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        gameplay.play()
+        gameplay.reset()
+        games_count += 1
+    return games_count / (time.perf_counter() - start)
+
+
+class DecisionsCounter:
+    """
+    Counts calls of get_action of given agent and time of get_action and update, raises TimeIsUp when action
+    is asked for after deadline
+    """
+
+    def __init__(self, agent, deadline):
+        self.count = 0
+        self.time = 0.0
+        get_action = agent.get_action
+        update = agent.update
+
+        def counting_get_action(state):
+            start = time.perf_counter()
+            if start > deadline:
+                raise TimeIsUp()
+            action = get_action(state)
+            self.time += time.perf_counter() - start
+            self.count += 1
+            return action
+
+        def timed_update(state, action, reward, next_state):
+            start = time.perf_counter()
+            update(state, action, reward, next_state)
+            self.time += time.perf_counter() - start
+
+        agent.get_action = counting_get_action
+        agent.update = timed_update
+
+
+def print_results(results):
+    print('-----------------------------BENCHMARKS------------------------------')
+    for name, result in results.items():
+        print(f'  {name:<36}{result["value"]:>16.2f} {result["unit"]}')
+    print('---------------------------------------------------------------------')
+
+
+def compare_results(results, baseline, tolerance):
+    """ Prints results compared with baseline and returns names of regressed benchmarks """
+    regressions = []
+    print('-----------------------------BENCHMARKS------------------------------')
+    print(f'  {"benchmark":<36}{"baseline":>12}{"current":>12}{"change":>9}')
+    for name, result in results.items():
+        if name not in baseline:
+            print(f'  {name:<36}{"-":>12}{result["value"]:>12.2f}')
+            continue
+
+        base_value = baseline[name]['value']
+        change = (result['value'] - base_value) / base_value if base_value else 0.0
+        slowdown = -change if result['higher_is_better'] else change
+        regressed = slowdown > tolerance
+        if regressed:
+            regressions.append(name)
+        print(f'  {name:<36}{base_value:>12.2f}{result["value"]:>12.2f}{change:>+9.1%}'
+              f'{"  REGRESSION" if regressed else ""}')
+    print('---------------------------------------------------------------------')
+    return regressions
+
+
+if __name__ == '__main__':
+    try:
+        benchmark()
+    except DomainException as e:
+        print(f'ERROR: {e.message}', file=sys.stderr)
+        sys.exit(1)
@@ -64,6 +64,20 @@ class Board:
     def size(self):
         return self.__data.shape
 
+    def get_symmetries(self):
+        """ Returns boards symmetric to this one (8 for square board, 4 for rectangular), starting with itself """
+        flips = [self.__data, np.flipud(self.__data), np.fliplr(self.__data), np.flipud(np.fliplr(self.__data))]
+        if self.size[0] == self.size[1]:
+            flips += [flip.T for flip in flips]
+        return [Board(np.array(flip)) for flip in flips]
+
+    def get_canonical(self):
+        """ Returns the symmetric board with the lowest number """
+        symmetries = self.get_symmetries()
+        flattened = np.stack([symmetry.__data.flatten() for symmetry in symmetries])
+        lowest_ix = np.lexsort(flattened.T[::-1])[0]
+        return symmetries[lowest_ix]
+
     def as_numpy_array(self):
         return np.array(self.__data)
 
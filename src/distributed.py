@@ -0,0 +1,279 @@
+from pathlib import Path
+import hashlib
+import hmac
+import pickle
+import queue
+import signal
+import socket
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+from tqdm import tqdm
+
+from agents import agents
+from backend import LiveBackend, PreparedBackend
+from gameplay import NoGuiGameplay
+from training import ParallelTraining, RecordingGameplay, play_recorded_games, apply_recorded_game
+from exceptions import DomainException
+
+
+class DistributedTraining:
+    """
+    Trains agent on games played by workers connected over TCP.
+
+    Coordinator hands out batches of games to connected workers together with the newest learner data,
+    workers send back compressed transitions of learner agent. Workers can join and leave at any time,
+    games of worker which left are handed out again. Opponent gets files with its saved data, so agents
+    keeping data outside of get_data_to_save play the same as in the coordinator.
+
+    Messages are pickled and signed with HMAC of secret shared by the coordinator and workers, message with
+    wrong signature closes the connection before it is unpickled.
+    """
+
+    DEFAULT_BATCH_GAMES = 10
+    DEFAULT_SYNC_INTERVAL = 50
+    ACCEPT_TIMEOUT = 0.5
+    IDLE_SLEEP = 0.1
+
+    def __init__(
+            self,
+            address,
+            size,
+            live,
+            number,
+            learner,
+            opponent,
+            learner_params,
+            opponent_params,
+            opponent_data_paths,
+            backend,
+            secret,
+            batch_games=DEFAULT_BATCH_GAMES,
+            sync_interval=DEFAULT_SYNC_INTERVAL
+    ):
+        if learner.NAME not in ParallelTraining.TRAINABLE_AGENTS:
+            raise DomainException(f'Agent {learner.NAME} can not be trained in distributed way')
+
+        self.address = address
+        self.size = size
+        self.live = live
+        self.number = number
+        self.learner = learner
+        self.opponent = opponent
+        self.learner_params = learner_params
+        self.opponent_params = opponent_params
+        self.opponent_data_paths = opponent_data_paths
+        self.backend = backend
+        self.secret = secret
+        self.batch_games = batch_games
+        self.sync_interval = sync_interval
+
+        self.interrupted = False
+        self.results = None
+
+        self.__lock = threading.Lock()
+        self.__unassigned_games = 0
+        self.__finished = threading.Event()
+        self.__snapshot = None
+        self.__results_queue = queue.Queue()
+
+    def play(self):
+        """ Returns learner wins, opponent wins and draws """
+        self.results = [0, 0, 0]
+        self.__unassigned_games = self.number
+        self.__snapshot = (0, pickle.dumps(self.learner.get_data_to_save()))
+        setup = self.__get_setup()
+
+        gameplay = NoGuiGameplay(self.size, 0, self.backend)
+        gameplay.set_players(self.learner, self.opponent)
+
+        server = socket.create_server(self.address)
+        server.settimeout(self.ACCEPT_TIMEOUT)
+        accept_thread = threading.Thread(target=self.__accept_loop, args=(server, setup), daemon=True)
+        accept_thread.start()
+        print(f'Waiting for workers on {self.address[0]}:{self.address[1]}...')
+
+        signal.signal(signal.SIGINT, self.__interrupt_handler)
+        try:
+            self.__learn_loop()
+        finally:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            self.__finished.set()
+            accept_thread.join()
+            server.close()
+
+        return self.results
+
+    def __get_setup(self):
+        opponent_files = {path.name: path.read_bytes() for path in self.opponent_data_paths}
+        return {
+            'size': self.size,
+            'live': self.live,
+            'learner': (self.learner.NAME, self.learner_params),
+            'opponent': (self.opponent.NAME, self.opponent_params, opponent_files),
+        }
+
+    # ------- main thread ------
+
+    def __learn_loop(self):
+        finished_games = 0
+        synced_games = 0
+        tqdm_iterator = tqdm(total=self.number, desc='Training', unit=' play')
+
+        while finished_games < self.number and not self.interrupted:
+            try:
+                games = self.__results_queue.get(timeout=self.ACCEPT_TIMEOUT)
+            except queue.Empty:
+                continue
+
+            for transitions, result in games:
+                apply_recorded_game(self.learner, transitions)
+                self.results[result] += 1
+            finished_games += len(games)
+            tqdm_iterator.update(len(games))
+            tqdm_iterator.set_postfix_str(f'Wins: {self.results[0]}/{self.results[1]}/{self.results[2]}')
+
+            if finished_games - synced_games >= self.sync_interval:
+                synced_games = finished_games
+                version = self.__snapshot[0] + 1
+                self.__snapshot = (version, pickle.dumps(self.learner.get_data_to_save()))
+
+        tqdm_iterator.close()
+
+    def __interrupt_handler(self, _sigint, _frame):
+        self.interrupted = True
+
+    # ------- connections threads ------
+
+    def __accept_loop(self, server, setup):
+        while not self.__finished.is_set():
+            try:
+                connection, address = server.accept()
+            except socket.timeout:
+                continue
+            thread = threading.Thread(target=self.__serve_worker, args=(connection, address, setup), daemon=True)
+            thread.start()
+
+    def __serve_worker(self, connection, address, setup):
+        worker_version = -1
+        games = 0
+
+        try:
+            with connection:
+                connection.settimeout(None)
+                send_message(connection, ('setup', setup), self.secret)
+
+                while True:
+                    games = self.__take_games()
+                    if games == 0:
+                        if self.__finished.is_set():
+                            send_message(connection, ('stop',), self.secret)
+                            return
+                        time.sleep(self.IDLE_SLEEP)
+                        continue
+
+                    version, data = self.__snapshot
+                    send_message(connection, ('task', games, data if version > worker_version else None),
+                                 self.secret)
+                    worker_version = max(version, worker_version)
+
+                    message = receive_message(connection, self.secret)
+                    self.__results_queue.put(message[1])
+                    games = 0
+        except (ConnectionError, OSError):
+            tqdm.write(f'Worker {address[0]}:{address[1]} disconnected')
+        finally:
+            self.__return_games(games)
+
+    def __take_games(self):
+        with self.__lock:
+            if self.interrupted:
+                return 0
+            games = min(self.batch_games, self.__unassigned_games)
+            self.__unassigned_games -= games
+            return games
+
+    def __return_games(self, games):
+        with self.__lock:
+            self.__unassigned_games += games
+
+
+def run_worker(address, secret, get_path_to_backend_data):
+    """ Connects to coordinator and plays games it hands out, until coordinator stops it """
+    with socket.create_connection(address) as connection, tempfile.TemporaryDirectory() as data_directory:
+        _, setup = receive_message(connection, secret)
+
+        size = setup['size']
+        backend = LiveBackend(size) if setup['live'] else PreparedBackend(size, get_path_to_backend_data(size))
+
+        learner_name, learner_params = setup['learner']
+        learner = agents[learner_name](**learner_params)
+        learner.learn = True
+
+        opponent_name, opponent_params, opponent_files = setup['opponent']
+        opponent = agents[opponent_name](**opponent_params)
+        opponent.learn = False
+        # opponent loads its files the same way as in coordinator, they must outlive it as they may be memory-mapped
+        for filename, content in opponent_files.items():
+            (Path(data_directory) / filename).write_bytes(content)
+        opponent.load_data(Path(data_directory) / f'{opponent_name}.pickle')
+
+        gameplay = RecordingGameplay(size, 0, backend, learner)
+        initialized = False
+
+        while True:
+            message = receive_message(connection, secret)
+            if message[0] == 'stop':
+                break
+
+            _, games_count, data = message
+            if data is not None:
+                learner_data = pickle.loads(data)
+                if learner_data is not None:
+                    learner.set_saved_data(learner_data)
+                if initialized:
+                    learner.initialize()
+
+            if not initialized:
+                gameplay.set_players(learner, opponent)
+                initialized = True
+
+            games = play_recorded_games(gameplay, learner, opponent, games_count)
+            send_message(connection, ('result', games), secret)
+
+
+_MESSAGE_HEADER = struct.Struct('>I')
+_SIGNATURE_SIZE = hashlib.sha256().digest_size
+
+
+def send_message(connection, message, secret):
+    payload = zlib.compress(pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL))
+    signature = _sign(payload, secret)
+    connection.sendall(_MESSAGE_HEADER.pack(len(payload)) + signature + payload)
+
+
+def receive_message(connection, secret):
+    size, = _MESSAGE_HEADER.unpack(_receive_exactly(connection, _MESSAGE_HEADER.size))
+    signature = _receive_exactly(connection, _SIGNATURE_SIZE)
+    payload = _receive_exactly(connection, size)
+    if not hmac.compare_digest(signature, _sign(payload, secret)):
+        raise ConnectionError('Message is not signed with the shared secret')
+    return pickle.loads(zlib.decompress(payload))
+
+
+def _sign(payload, secret):
+    return hmac.new(secret.encode(), payload, hashlib.sha256).digest()
+
+
+def _receive_exactly(connection, size):
+    chunks = []
+    while size > 0:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
@@ -12,6 +12,10 @@ class Environment:
         self.__size = size
         self.__backend = backend
 
+    @property
+    def size(self):
+        return self.__size
+
     def get_all_states(self):
         return self.__backend.get_all_possible_boards_numbers()
 
@@ -38,6 +42,11 @@ class Environment:
         probability = 1 / len(next_states)
         return {next_state: probability for next_state in next_states}
 
+    def get_afterstates(self, state, actions):
+        """ Returns states just after every action made in given state, before opponent move """
+        simulation = self.get_simulation_from_state(state)
+        return [self.cvt_board_to_state(simulation.copy().make_move(action).board) for action in actions]
+
     def get_reward(self, state, action, next_state):
         simulation = self.get_simulation_from_state(next_state)
         winner = simulation.get_winner()
@@ -51,9 +60,9 @@ class Environment:
 
     # auxiliary methods
 
-    def get_simulation_from_state(self, state):
+    def get_simulation_from_state(self, state, turn=Side.ME):
         board = self.cvt_state_to_board(state)
-        return Simulation(board, Side.ME, self.__backend)
+        return Simulation(board, turn, self.__backend)
 
     def get_simulation_from_position(self, position):
         return Simulation.create_from_number(self.__size, position, self.__backend)
@@ -1,4 +1,5 @@
 class DomainException(Exception):
     def __init__(self, message):
-        super().__init__()
+        # message is passed also to base class, so exception can be pickled, e.g. to be sent from worker process
+        super().__init__(message)
         self.message = message
@@ -1,9 +1,9 @@
 import time
 import signal
+import threading
 from abc import ABC, abstractmethod
 from itertools import count
 
-import pygame
 from tqdm import tqdm
 
 from simulation import Simulation
@@ -24,6 +24,11 @@ class Gameplay(ABC):
 
         self._player_black = None
         self._player_white = None
+        self._recorder = None
+
+        self._time_control = None
+        self.__ponder = False
+        self.__ponderings = {}
 
     def set_players(self, player_black, player_white):
         self._player_black = player_black
@@ -32,12 +37,31 @@ class Gameplay(ABC):
         self.__config_player(player_black)
         self.__config_player(player_white)
 
+    def set_recorder(self, recorder):
+        """ Sets recorder which every played game is written to """
+        self._recorder = recorder
+
+    def set_time_control(self, time_control, ponder=False):
+        """ Sets time control limiting decisions of agents and whether agents think during opponent's turn """
+        self._time_control = time_control
+        self.__ponder = ponder
+
     def swap_players(self):
         self._player_black, self._player_white = self._player_white, self._player_black
 
     def play(self):
         self.__before_gameplay()
-        self._play()
+        if self._recorder is not None:
+            self._recorder.start_game(self._player_black)
+        if self._time_control is not None:
+            self._time_control.start_game()
+        try:
+            self._play()
+        finally:
+            self.__stop_pondering(self._player_black)
+            self.__stop_pondering(self._player_white)
+        if self._recorder is not None and self._simulation.is_finished():
+            self._recorder.finish_game(self._simulation.get_winner())
         self.__after_gameplay()
         return self.__get_winner()
 
@@ -54,6 +78,20 @@ class Gameplay(ABC):
     def _get_decisive_player(self):
         return self._player_white if self._simulation.turn == Color.WHITE else self._player_black
 
+    def _get_action(self, player, state):
+        """ Returns action chosen by player, with deadline set by time control """
+        self.__stop_pondering(player)
+        if self._time_control is None:
+            return player.get_action(state)
+
+        player.deadline = self._time_control.get_deadline(player, self._simulation.board.get_discs_count(Color.ANY))
+        start = time.perf_counter()
+        try:
+            return player.get_action(state)
+        finally:
+            self._time_control.charge(player, time.perf_counter() - start)
+            player.deadline = None
+
     def _get_state_for_player(self, player):
         color = Color.BLACK if player == self._player_black else Color.WHITE
         return self._env.cvt_board_to_state(self._simulation.board.to_relative(color))
@@ -67,6 +105,9 @@ class Gameplay(ABC):
             moving_player.last_state = state
             moving_player.last_action = action
 
+        if self._recorder is not None:
+            self._recorder.add_move(action, self._simulation.turn)
+
         # just move
         self._simulation.make_move(action)
 
@@ -77,6 +118,10 @@ class Gameplay(ABC):
         else:
             self.__update_agent(self._get_decisive_player())
 
+        # player which moved thinks during opponent's turn, unless opponent passes
+        if self.__ponder and not self._simulation.is_finished() and self._get_decisive_player() is not moving_player:
+            self.__start_pondering(moving_player)
+
     def __get_winner(self):
         winner_color = self._simulation.get_winner()
         if winner_color == Color.WHITE:
@@ -86,11 +131,22 @@ class Gameplay(ABC):
         else:
             return None
 
+    def __start_pondering(self, player):
+        if player is not None:
+            self.__ponderings[player] = Pondering(player, self._get_state_for_player(player))
+
+    def __stop_pondering(self, player):
+        pondering = self.__ponderings.pop(player, None)
+        if pondering is not None:
+            pondering.stop()
+
     def __config_player(self, player):
         if isinstance(player, PassiveAgent):
             player.env = self._env
         elif isinstance(player, ActiveAgent):
             player.get_possible_actions = self._env.get_possible_actions
+            player.get_afterstates = self._env.get_afterstates
+            player.size = self._size
 
         if player is not None:
             player.initialize()
@@ -108,10 +164,15 @@ class Gameplay(ABC):
             self._player_white.after_gameplay()
 
     def __update_agent(self, player):
+        # agent must not learn while it still thinks in background
+        self.__stop_pondering(player)
         if player is not None and player.last_action is not None:
             state = self._get_state_for_player(player)
             reward = self._env.get_reward(player.last_state, player.last_action, state)
-            player.update(player.last_state, player.last_action, reward, state)
+            self._notify_agent(player, player.last_state, player.last_action, reward, state)
+
+    def _notify_agent(self, player, state, action, reward, next_state):
+        player.update(state, action, reward, next_state)
 
 
 class NoGuiGameplay(Gameplay):
@@ -125,244 +186,53 @@ class NoGuiGameplay(Gameplay):
         while not self._simulation.is_finished():
             player = self._get_decisive_player()
             state = self._get_state_for_player(player)
-            action = player.get_action(state)
+            action = self._get_action(player, state)
             self._make_move(action)
 
 
-class GuiGameplay(Gameplay):
+class Pondering:
+    """
+    Thinking of agent during opponent's turn in background thread.
 
-    FIELD_SIZE = 100
-    DISC_SIZE = 80
+    Agent gets its state after its own move and event, which is set when opponent made its move, then
+    stop waits until agent notices it. In one process pondering shares processor time with opponent.
+    """
 
-    WHITE_COLOR = (255, 255, 255)
-    BLACK_COLOR = (0, 0, 0)
-    MIDDLE_COLOR = (127, 127, 127)
-    BOARD_COLOR = (0, 127, 0)
-    LINES_COLOR = (0, 150, 0)
-    TEXT_COLOR = (0, 0, 0)
+    def __init__(self, agent, state):
+        self.__stop_event = threading.Event()
+        self.__thread = threading.Thread(target=agent.ponder, args=(state, self.__stop_event), daemon=True)
+        self.__thread.start()
 
-    def __init__(self, size, delay, backend):
-        super().__init__(size, delay, backend)
-
-        self.__running = True
-        self.__screen = None
-
-        self.__turn_font = None
-        self.__winner_font = None
-
-        self.__last_move = None
-        self.__pending_move = None
-
-        self.__before_move_time = None
-        self.__after_move_time = None
-        self.__finish_time = None
-
-    def reset(self):
-        super().reset()
-        self.__running = True
-        self.__last_move = None
-        self.__pending_move = None
-
-        self.__before_move_time = None
-        self.__after_move_time = None
-        self.__finish_time = None
-
-    def dispose(self):
-        pygame.quit()
-        self.__screen = None
-
-    # ----------------- update logic stuff ---------------------
-
-    def _play(self):
-        self.__init_gui_if_needed()
-
-        while self.__should_run():
-            self.__collect_events()
-            self.__update()
-            self.__draw_screen()
-
-    def __should_run(self):
-        in_progress = not self._simulation.is_finished()
-        cooldown_not_elapsed = self.__finish_time is not None and self.__finish_time + self._delay > time.time()
-        return (in_progress or cooldown_not_elapsed) and self.__running
-
-    def __update(self):
-        if not self._simulation.is_finished():
-            self.__update_move()
-            if self._simulation.is_finished():
-                self.__finish_time = time.time()
-
-    def __update_move(self):
-        current_time = time.time()
-
-        # get move
-        if self.__pending_move is None:
-            decisive_player = self._get_decisive_player()
-            self.__pending_move = self.__get_move_from_player(decisive_player)
-            self.__before_move_time = current_time
-
-        # draw move
-        if self.__before_move_time is not None and self.__before_move_time + self._delay < current_time:
-            self.__last_move = self.__pending_move
-            self.__before_move_time = None
-            self.__after_move_time = current_time
-
-        # apply move
-        if self.__after_move_time is not None and self.__after_move_time + self._delay < current_time:
-            self._make_move(self.__pending_move)
-            self.__pending_move = None
-            self.__after_move_time = None
-
-    def __get_move_from_player(self, player):
-        if player is None:
-            return self.__get_move_from_real_player()
-        else:
-            return self.__get_move_from_artificial_player(player)
-
-    def __get_move_from_artificial_player(self, player):
-        state = self._get_state_for_player(player)
-        return player.get_action(state)
-
-    def __get_move_from_real_player(self):
-        possible_moves = self._simulation.get_moves()
-        pressed = pygame.mouse.get_pressed()
-        if pressed[0]:
-            mouse_pos = pygame.mouse.get_pos()
-            move_pos = (mouse_pos[1] // self.FIELD_SIZE, mouse_pos[0] // self.FIELD_SIZE)
-            if move_pos in possible_moves:
-                return move_pos
-            return None
-        return None
-
-    # ----------------- pure GUI stuff ---------------------
-
-    def __init_gui_if_needed(self):
-        if not pygame.get_init():
-            pygame.init()
-
-            screen_width = self._size[1] * self.FIELD_SIZE
-            screen_height = self._size[0] * self.FIELD_SIZE + 40
-            self.__screen = pygame.display.set_mode([screen_width, screen_height])
-            pygame.display.set_caption(f'Reversi {self._size[0]}x{self._size[1]}')
-
-            self.__turn_font = pygame.font.Font(pygame.font.get_default_font(), 20)
-            self.__winner_font = pygame.font.Font(pygame.font.get_default_font(), 40)
-
-    def __collect_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                self.__running = False
-                signal.raise_signal(signal.SIGINT)
-
-    def __draw_screen(self):
-        if self._simulation.is_finished():
-            self.__draw_finish_screen()
-        else:
-            self.__draw_standard_screen()
-
-        pygame.display.flip()
-
-    def __draw_standard_screen(self):
-        self.__draw_board()
-        self.__draw_discs()
-        self.__draw_last_move()
-        self.__draw_turn()
-
-    def __draw_finish_screen(self):
-        winner = self._simulation.get_winner()
-        text = self.__get_winner_text(winner)
-        color = self.__get_winner_color(winner)
-
-        text_surface = self.__winner_font.render(text, True, self.TEXT_COLOR)
-        text_pos = (
-            (self.__screen.get_width() - text_surface.get_width()) // 2,
-            (self.__screen.get_height() - text_surface.get_height()) // 2
-        )
-        circle_pos = (self.__screen.get_width() // 2, self.__screen.get_height() // 2 + 60)
-
-        self.__screen.fill(self.BOARD_COLOR)
-        self.__screen.blit(text_surface, text_pos)
-        pygame.draw.circle(self.__screen, color, circle_pos, 20)
-
-    def __draw_board(self):
-        self.__screen.fill(self.BOARD_COLOR)
-        pygame.draw.rect(self.__screen, self.LINES_COLOR,
-                         (0, 0, self._size[1] * self.FIELD_SIZE, self._size[0] * self.FIELD_SIZE), width=3)
-        for y in range(1, self._size[0]):
-            pygame.draw.line(self.__screen, self.LINES_COLOR, (0, y * self.FIELD_SIZE),
-                             (self._size[1] * self.FIELD_SIZE, y * self.FIELD_SIZE), width=3)
-        for x in range(1, self._size[1]):
-            pygame.draw.line(self.__screen, self.LINES_COLOR, (x * self.FIELD_SIZE, 0),
-                             (x * self.FIELD_SIZE, self._size[0] * self.FIELD_SIZE), width=3)
-
-    def __draw_discs(self):
-        possible_moves = self._simulation.get_moves()
-        disc_center_offset = self.FIELD_SIZE // 2
-        for y in range(self._size[0]):
-            for x in range(self._size[1]):
-                disc_color = self._simulation.board[y, x]
-                pos = (x * self.FIELD_SIZE + disc_center_offset, y * self.FIELD_SIZE + disc_center_offset)
-                if disc_color == Color.ANY and (y, x) in possible_moves:
-                    color = self.WHITE_COLOR if self._simulation.turn == Color.WHITE else self.BLACK_COLOR
-                    pygame.draw.circle(self.__screen, color, pos, self.DISC_SIZE // 2, width=3)
-                elif disc_color != Color.ANY:
-                    color = self.WHITE_COLOR if disc_color == Color.WHITE else self.BLACK_COLOR
-                    pygame.draw.circle(self.__screen, color, pos, self.DISC_SIZE // 2)
-
-    def __draw_last_move(self):
-        if self.__last_move is not None:
-            y, x = self.__last_move
-            x_pos, y_pos = x * self.FIELD_SIZE + self.FIELD_SIZE // 2, y * self.FIELD_SIZE + self.FIELD_SIZE // 2
-            pygame.draw.line(self.__screen, (255, 0, 0), (x_pos, 0), (x_pos, self._size[0] * self.FIELD_SIZE), width=2)
-            pygame.draw.line(self.__screen, (255, 0, 0), (0, y_pos), (self._size[1] * self.FIELD_SIZE, y_pos), width=2)
-
-    def __draw_turn(self):
-        color = self.WHITE_COLOR if self._simulation.turn == Color.WHITE else self.BLACK_COLOR
-        name = self.__get_player_name(self._get_decisive_player())
-
-        pygame.draw.circle(self.__screen, color, (20, self.__screen.get_height() - 21), 11)
-        turn_text = self.__turn_font.render(name, True, self.TEXT_COLOR)
-        self.__screen.blit(turn_text, (40, self.__screen.get_height() - 30))
-
-    def __get_winner_text(self, winner):
-        if winner == Color.BLACK:
-            return self.__get_player_name(self._player_black)
-        elif winner == Color.WHITE:
-            return self.__get_player_name(self._player_white)
-        else:
-            return 'draw'
-
-    def __get_winner_color(self, winner):
-        if winner == Color.BLACK:
-            return self.BLACK_COLOR
-        elif winner == Color.WHITE:
-            return self.WHITE_COLOR
-        else:
-            return self.MIDDLE_COLOR
-
-    @staticmethod
-    def __get_player_name(player):
-        if player is None:
-            return 'Human'
-        else:
-            return player.NAME.replace('_', ' ').upper()
+    def stop(self):
+        self.__stop_event.set()
+        self.__thread.join()
 
 
 class Tournament:
 
-    def __init__(self, gameplay, number, player1, player2):
+    def __init__(self, gameplay, number, player1, player2, profiler=None, sprt=None, checkpoint=None,
+                 checkpoint_interval=None):
         self.gameplay = gameplay
         self.number = number
 
         self.player1 = player1
         self.player2 = player2
+        self.profiler = profiler
+        self.sprt = sprt
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
 
         self.interrupted = False
         self.results = None
 
     def play(self):
         self.__setup()
+        start = time.perf_counter()
         self.__interruptable_play_loop()
+        if self.profiler is not None:
+            self.profiler.print_summary(time.perf_counter() - start)
+        if self.sprt is not None:
+            print('\n'.join(self.sprt.get_summary(self.results)))
         return self.results
 
     def __setup(self):
@@ -388,6 +258,21 @@ class Tournament:
             if self.interrupted:
                 break
 
+            # games are played in pairs, so both players had the same number of games as black
+            games = sum(self.results)
+            if self.sprt is not None and games % 2 == 0 and self.sprt.get_decision(self.results):
+                break
+
+            if self.__should_checkpoint(games):
+                self.checkpoint()
+
+    def __should_checkpoint(self, games):
+        # agents data is saved after the last game anyway
+        if self.checkpoint is None or not self.checkpoint_interval:
+            return False
+        last_game = self.number is not None and games >= self.number
+        return games % self.checkpoint_interval == 0 and not last_game
+
     def __play_once(self):
         winner = self.gameplay.play()
 
@@ -400,3 +285,106 @@ class Tournament:
 
         self.gameplay.reset()
         self.gameplay.swap_players()
+
+
+class LockstepTournament:
+    """
+    Tournament of not learning agents advancing many games at once.
+
+    In every step states of all games waiting for decision of the same player are passed together to its
+    get_actions, so agents can choose actions for many games in one batch. Players swap colours after every
+    game, as in the serial tournament.
+    """
+
+    DEFAULT_GAMES = 32
+
+    def __init__(self, size, backend, number, player1, player2, games=DEFAULT_GAMES):
+        if None in [player1, player2]:
+            raise DomainException('Human players are not allowed in lockstep games')
+        if player1.learn or player2.learn:
+            raise DomainException('Learning agents can not play lockstep games')
+
+        self.size = size
+        self.backend = backend
+        self.number = number
+        self.games = games
+
+        self.player1 = player1
+        self.player2 = player2
+
+        self.interrupted = False
+        self.results = None
+
+    def play(self):
+        # gameplay is used only to configure players
+        gameplay = NoGuiGameplay(self.size, 0, self.backend)
+        gameplay.set_players(self.player1, self.player2)
+        env = Environment(self.size, self.backend)
+
+        self.results = [0, 0, 0]
+        started_games = min(self.games, self.number)
+        running = [self.__start_game(index) for index in range(started_games)]
+        tqdm_iterator = tqdm(total=self.number, desc='Playing', unit=' play')
+
+        signal.signal(signal.SIGINT, self.__interrupt_handler)
+        try:
+            while running:
+                for (player, color), waiting in self.__group_by_decisive_player(running).items():
+                    states = [env.cvt_board_to_state(game[0].board.to_relative(color)) for game in waiting]
+                    for game, action in zip(waiting, player.get_actions(states)):
+                        game[0].make_move(action)
+
+                finished, unfinished = [], []
+                for game in running:
+                    (finished if game[0].is_finished() else unfinished).append(game)
+                for game in finished:
+                    self.__record_result(game)
+                running = unfinished
+
+                tqdm_iterator.update(len(finished))
+                tqdm_iterator.set_postfix_str(f'Wins: {self.results[0]}/{self.results[1]}/{self.results[2]}')
+
+                while len(running) < self.games and started_games < self.number and not self.interrupted:
+                    running.append(self.__start_game(started_games))
+                    started_games += 1
+        finally:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            tqdm_iterator.close()
+
+        return self.results
+
+    def __start_game(self, index):
+        """ Returns simulation with black and white player, first player is black in games with even index """
+        simulation = Simulation.create_initial(self.size, self.backend)
+        if index % 2 == 0:
+            return simulation, self.player1, self.player2
+        return simulation, self.player2, self.player1
+
+    @staticmethod
+    def __group_by_decisive_player(games):
+        groups = {}
+        for game in games:
+            simulation, player_black, player_white = game
+            key = (player_white, Color.WHITE) if simulation.turn == Color.WHITE else (player_black, Color.BLACK)
+            groups.setdefault(key, []).append(game)
+        return groups
+
+    def __record_result(self, game):
+        simulation, player_black, player_white = game
+        winner_color = simulation.get_winner()
+        if winner_color == Color.WHITE:
+            winner = player_white
+        elif winner_color == Color.BLACK:
+            winner = player_black
+        else:
+            winner = None
+
+        if winner is self.player1:
+            self.results[0] += 1
+        elif winner is self.player2:
+            self.results[1] += 1
+        else:
+            self.results[2] += 1
+
+    def __interrupt_handler(self, _sigint, _frame):
+        self.interrupted = True
@@ -0,0 +1,375 @@
+import signal
+import threading
+import time
+from functools import partial
+
+import pygame
+
+from gameplay import Gameplay
+from board import Color
+
+
+class GuiGameplay(Gameplay):
+    """
+    Gameplay shown in pygame window.
+
+    Artificial players choose actions in background thread, so window keeps responding during long decisions.
+    Frames are limited to FPS and only fields which look different than in previous frame are redrawn.
+    """
+
+    FIELD_SIZE = 100
+    DISC_SIZE = 80
+    STATUS_HEIGHT = 40
+    FPS = 60
+
+    WHITE_COLOR = (255, 255, 255)
+    BLACK_COLOR = (0, 0, 0)
+    MIDDLE_COLOR = (127, 127, 127)
+    BOARD_COLOR = (0, 127, 0)
+    LINES_COLOR = (0, 150, 0)
+    LAST_MOVE_COLOR = (255, 0, 0)
+    TEXT_COLOR = (0, 0, 0)
+
+    def __init__(self, size, delay, backend):
+        super().__init__(size, delay, backend)
+
+        self.__running = True
+        self.__screen = None
+        self.__clock = None
+
+        self.__turn_font = None
+        self.__winner_font = None
+
+        self.__last_move = None
+        self.__pending_move = None
+        self.__decision = None
+        self.__possible_moves = None
+        self.__finished = None
+
+        self.__before_move_time = None
+        self.__after_move_time = None
+        self.__finish_time = None
+
+        self.__drawn_fields = None
+        self.__drawn_status = None
+
+    def reset(self):
+        super().reset()
+        self.__stop_decision()
+        self.__running = True
+        self.__last_move = None
+        self.__pending_move = None
+        self.__possible_moves = None
+        self.__finished = None
+
+        self.__before_move_time = None
+        self.__after_move_time = None
+        self.__finish_time = None
+
+        self.__drawn_fields = None
+        self.__drawn_status = None
+
+    def dispose(self):
+        self.__stop_decision()
+        pygame.quit()
+        self.__screen = None
+
+    def _make_move(self, action):
+        super()._make_move(action)
+        self.__possible_moves = None
+        self.__finished = None
+
+    # ----------------- update logic stuff ---------------------
+
+    def _play(self):
+        self.__init_gui_if_needed()
+
+        # decision is stopped also when window is closed, so agent is not deciding while its data is saved
+        try:
+            while self.__should_run():
+                self.__collect_events()
+                self.__update()
+                self.__draw_screen()
+                self.__clock.tick(self.FPS)
+        finally:
+            self.__stop_decision()
+
+    def __should_run(self):
+        in_progress = not self.__is_finished()
+        cooldown_not_elapsed = self.__finish_time is not None and self.__finish_time + self._delay > time.time()
+        return (in_progress or cooldown_not_elapsed) and self.__running
+
+    def __update(self):
+        if not self.__is_finished():
+            self.__update_move()
+            if self.__is_finished():
+                self.__finish_time = time.time()
+
+    def __update_move(self):
+        current_time = time.time()
+
+        # get move
+        if self.__pending_move is None:
+            decisive_player = self._get_decisive_player()
+            self.__pending_move = self.__get_move_from_player(decisive_player)
+            if self.__pending_move is not None:
+                self.__before_move_time = current_time
+
+        # draw move
+        if self.__before_move_time is not None and self.__before_move_time + self._delay < current_time:
+            self.__last_move = self.__pending_move
+            self.__before_move_time = None
+            self.__after_move_time = current_time
+
+        # apply move
+        if self.__after_move_time is not None and self.__after_move_time + self._delay < current_time:
+            self._make_move(self.__pending_move)
+            self.__pending_move = None
+            self.__after_move_time = None
+
+    def __get_move_from_player(self, player):
+        if player is None:
+            return self.__get_move_from_real_player()
+        else:
+            return self.__get_move_from_artificial_player(player)
+
+    def __get_move_from_artificial_player(self, player):
+        """ Starts decision of player in background thread and returns its action when it is ready """
+        if self.__decision is None:
+            state = self._get_state_for_player(player)
+            self.__decision = AgentDecision(player, partial(self._get_action, player), state)
+
+        if not self.__decision.is_ready():
+            return None
+
+        action = self.__decision.get_action()
+        self.__decision = None
+        return action
+
+    def __stop_decision(self):
+        if self.__decision is not None:
+            self.__decision.stop()
+            self.__decision = None
+
+    def __get_move_from_real_player(self):
+        pressed = pygame.mouse.get_pressed()
+        if pressed[0]:
+            mouse_pos = pygame.mouse.get_pos()
+            move_pos = (mouse_pos[1] // self.FIELD_SIZE, mouse_pos[0] // self.FIELD_SIZE)
+            if move_pos in self.__get_possible_moves():
+                return move_pos
+            return None
+        return None
+
+    def __get_possible_moves(self):
+        # moves and end of game are checked in every frame, so they are calculated once per position
+        if self.__possible_moves is None:
+            self.__possible_moves = set(self._simulation.get_moves())
+        return self.__possible_moves
+
+    def __is_finished(self):
+        if self.__finished is None:
+            self.__finished = self._simulation.is_finished()
+        return self.__finished
+
+    # ----------------- pure GUI stuff ---------------------
+
+    def __init_gui_if_needed(self):
+        if not pygame.get_init():
+            pygame.init()
+
+            screen_width = self._size[1] * self.FIELD_SIZE
+            screen_height = self._size[0] * self.FIELD_SIZE + self.STATUS_HEIGHT
+            self.__screen = pygame.display.set_mode([screen_width, screen_height])
+            pygame.display.set_caption(f'Reversi {self._size[0]}x{self._size[1]}')
+
+            self.__turn_font = pygame.font.Font(pygame.font.get_default_font(), 20)
+            self.__winner_font = pygame.font.Font(pygame.font.get_default_font(), 40)
+            self.__clock = pygame.time.Clock()
+
+    def __collect_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.__running = False
+                signal.raise_signal(signal.SIGINT)
+            elif event.type == pygame.WINDOWEXPOSED:
+                self.__drawn_fields = None
+                self.__drawn_status = None
+
+    def __draw_screen(self):
+        if self.__is_finished():
+            if self.__drawn_status != 'finished':
+                self.__draw_finish_screen()
+                self.__drawn_status = 'finished'
+                self.__drawn_fields = None
+                pygame.display.flip()
+            return
+
+        dirty_rects = self.__draw_changed_fields() + self.__draw_changed_status()
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
+
+    def __draw_changed_fields(self):
+        """ Redraws fields whose look changed since previous frame and returns their rectangles """
+        fields = self.__get_fields_look()
+        if self.__drawn_fields is None:
+            rects = [pygame.Rect(0, 0, self._size[1] * self.FIELD_SIZE, self._size[0] * self.FIELD_SIZE)]
+        else:
+            rects = [pygame.Rect(x * self.FIELD_SIZE, y * self.FIELD_SIZE, self.FIELD_SIZE, self.FIELD_SIZE)
+                     for (y, x), look in fields.items() if self.__drawn_fields[y, x] != look]
+        self.__drawn_fields = fields
+
+        for rect in rects:
+            # whole board is drawn clipped to the field, so lines crossing many fields join as in full redraw
+            self.__screen.set_clip(rect)
+            self.__draw_board()
+            self.__draw_discs()
+            self.__draw_last_move()
+            self.__screen.set_clip(None)
+        return rects
+
+    def __get_fields_look(self):
+        """ Returns everything drawn on every field: disc, possible move marker and last move lines """
+        possible_moves = self.__get_possible_moves()
+        last_y, last_x = self.__last_move if self.__last_move is not None else (None, None)
+        fields = {}
+        for y in range(self._size[0]):
+            for x in range(self._size[1]):
+                marker = self._simulation.turn if (y, x) in possible_moves else None
+                fields[y, x] = (self._simulation.board[y, x], marker, y == last_y, x == last_x)
+        return fields
+
+    def __draw_changed_status(self):
+        status = (self._simulation.turn, self.__get_player_name(self._get_decisive_player()))
+        if status == self.__drawn_status:
+            return []
+        self.__drawn_status = status
+
+        rect = pygame.Rect(0, self._size[0] * self.FIELD_SIZE, self.__screen.get_width(), self.STATUS_HEIGHT)
+        self.__screen.fill(self.BOARD_COLOR, rect)
+        self.__draw_turn()
+        return [rect]
+
+    def __draw_finish_screen(self):
+        winner = self._simulation.get_winner()
+        text = self.__get_winner_text(winner)
+        color = self.__get_winner_color(winner)
+
+        text_surface = self.__winner_font.render(text, True, self.TEXT_COLOR)
+        text_pos = (
+            (self.__screen.get_width() - text_surface.get_width()) // 2,
+            (self.__screen.get_height() - text_surface.get_height()) // 2
+        )
+        circle_pos = (self.__screen.get_width() // 2, self.__screen.get_height() // 2 + 60)
+
+        self.__screen.fill(self.BOARD_COLOR)
+        self.__screen.blit(text_surface, text_pos)
+        pygame.draw.circle(self.__screen, color, circle_pos, 20)
+
+    def __draw_board(self):
+        self.__screen.fill(self.BOARD_COLOR)
+        pygame.draw.rect(self.__screen, self.LINES_COLOR,
+                         (0, 0, self._size[1] * self.FIELD_SIZE, self._size[0] * self.FIELD_SIZE), width=3)
+        for y in range(1, self._size[0]):
+            pygame.draw.line(self.__screen, self.LINES_COLOR, (0, y * self.FIELD_SIZE),
+                             (self._size[1] * self.FIELD_SIZE, y * self.FIELD_SIZE), width=3)
+        for x in range(1, self._size[1]):
+            pygame.draw.line(self.__screen, self.LINES_COLOR, (x * self.FIELD_SIZE, 0),
+                             (x * self.FIELD_SIZE, self._size[0] * self.FIELD_SIZE), width=3)
+
+    def __draw_discs(self):
+        possible_moves = self.__get_possible_moves()
+        disc_center_offset = self.FIELD_SIZE // 2
+        clip = self.__screen.get_clip()
+        for y in range(self._size[0]):
+            for x in range(self._size[1]):
+                pos = (x * self.FIELD_SIZE + disc_center_offset, y * self.FIELD_SIZE + disc_center_offset)
+                if not clip.collidepoint(pos):
+                    continue
+                disc_color = self._simulation.board[y, x]
+                if disc_color == Color.ANY and (y, x) in possible_moves:
+                    color = self.WHITE_COLOR if self._simulation.turn == Color.WHITE else self.BLACK_COLOR
+                    pygame.draw.circle(self.__screen, color, pos, self.DISC_SIZE // 2, width=3)
+                elif disc_color != Color.ANY:
+                    color = self.WHITE_COLOR if disc_color == Color.WHITE else self.BLACK_COLOR
+                    pygame.draw.circle(self.__screen, color, pos, self.DISC_SIZE // 2)
+
+    def __draw_last_move(self):
+        if self.__last_move is not None:
+            y, x = self.__last_move
+            x_pos, y_pos = x * self.FIELD_SIZE + self.FIELD_SIZE // 2, y * self.FIELD_SIZE + self.FIELD_SIZE // 2
+            pygame.draw.line(self.__screen, self.LAST_MOVE_COLOR, (x_pos, 0),
+                             (x_pos, self._size[0] * self.FIELD_SIZE), width=2)
+            pygame.draw.line(self.__screen, self.LAST_MOVE_COLOR, (0, y_pos),
+                             (self._size[1] * self.FIELD_SIZE, y_pos), width=2)
+
+    def __draw_turn(self):
+        color = self.WHITE_COLOR if self._simulation.turn == Color.WHITE else self.BLACK_COLOR
+        name = self.__get_player_name(self._get_decisive_player())
+
+        pygame.draw.circle(self.__screen, color, (20, self.__screen.get_height() - 21), 11)
+        turn_text = self.__turn_font.render(name, True, self.TEXT_COLOR)
+        self.__screen.blit(turn_text, (40, self.__screen.get_height() - 30))
+
+    def __get_winner_text(self, winner):
+        if winner == Color.BLACK:
+            return self.__get_player_name(self._player_black)
+        elif winner == Color.WHITE:
+            return self.__get_player_name(self._player_white)
+        else:
+            return 'draw'
+
+    def __get_winner_color(self, winner):
+        if winner == Color.BLACK:
+            return self.BLACK_COLOR
+        elif winner == Color.WHITE:
+            return self.WHITE_COLOR
+        else:
+            return self.MIDDLE_COLOR
+
+    @staticmethod
+    def __get_player_name(player):
+        if player is None:
+            return 'Human'
+        else:
+            return player.NAME.replace('_', ' ').upper()
+
+
+class AgentDecision:
+    """
+    Action of agent chosen in background thread.
+
+    Exception raised by agent is raised again when action is taken. Stopped decision is abandoned, its thread
+    is joined with deadline of agent moved to now, so agents searching until deadline finish at once.
+    """
+
+    STOP_POLL_INTERVAL = 0.01
+
+    def __init__(self, agent, get_action, state):
+        self.__agent = agent
+        self.__action = None
+        self.__error = None
+        self.__thread = threading.Thread(target=self.__decide, args=(get_action, state), daemon=True)
+        self.__thread.start()
+
+    def is_ready(self):
+        return not self.__thread.is_alive()
+
+    def get_action(self):
+        self.__thread.join()
+        if self.__error is not None:
+            raise self.__error
+        return self.__action
+
+    def stop(self):
+        # deadline is set again until thread ends, as decision may set its own deadline when it starts
+        while self.__thread.is_alive():
+            self.__agent.deadline = time.perf_counter()
+            self.__thread.join(self.STOP_POLL_INTERVAL)
+        self.__agent.deadline = None
+
+    def __decide(self, get_action, state):
+        try:
+            self.__action = get_action(state)
+        except Exception as e:
+            self.__error = e
@@ -0,0 +1,230 @@
+from contextlib import redirect_stdout
+from functools import partial
+from itertools import combinations
+from pathlib import Path
+import hashlib
+import io
+import json
+import math
+import os
+import sys
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
+
+import click
+
+from agents import agents
+from gameplay import NoGuiGameplay, Tournament
+from training import ParallelTournament
+from backend import LiveBackend, PreparedBackend
+from reversi import construct_agent, parse_agent_params, get_path_to_agent_data, get_path_to_backend_data
+from reversi import get_paths_to_agent_data_files
+from exceptions import DomainException
+
+
+@click.command(help="Plays round-robin league between agents with their saved data and prints rating table, "
+                    "results of pairings whose agents data and parameters did not change are reused")
+@click.option('-s', '--size', nargs=2, type=int, default=(8, 8), help='Size of the map')
+@click.option('-n', '--number', type=int, default=100, help='Number of games of every pairing')
+@click.option('-p', '--player', 'players', multiple=True, type=click.Choice(list(agents.keys() - {'human'})),
+              help='Agent taking part in league, can be repeated, all agents by default')
+@click.option('-a', '--param', 'params', multiple=True, metavar='AGENT:KEY=VALUE',
+              help='Parameter of agent in form agent:key=value')
+@click.option('--live/--prepared', default=True, help='Whether use live or prepared backend')
+@click.option('-w', '--workers', type=int, default=1, help='Number of worker processes playing games')
+@click.option('--rerun', is_flag=True, default=False, help='Replay all pairings ignoring stored results')
+def league_command(size, number, players, params, live, workers, rerun):
+    size = tuple(size)
+    names = list(players) or [name for name in agents.keys() if name != 'human']
+    agents_params = parse_league_params(params, names)
+
+    if live:
+        backend_factory = partial(LiveBackend, size)
+    else:
+        backend_factory = partial(PreparedBackend, size, get_path_to_backend_data(size))
+
+    results_path = get_path_to_league_results(size)
+    league = League(size, number, backend_factory, workers, results_path)
+    for name in names:
+        league.add_agent(name, agents_params[name])
+
+    ratings = league.play(rerun)
+    print_ratings(ratings)
+
+
+class League:
+    """
+    Round-robin league of agents with their saved data.
+
+    Results of every pairing are stored with fingerprints of both agents, which are hashes of their saved data,
+    data of agents they depend on and parameters. Pairing is replayed only when fingerprint of any of its agents
+    changed, so after training one agent only its pairings are played again. Changes of agents code are not
+    detected, --rerun is needed then.
+    """
+
+    def __init__(self, size, number, backend_factory, workers, results_path):
+        self.size = size
+        self.number = number
+        self.backend_factory = backend_factory
+        self.workers = workers
+        self.results_path = Path(results_path)
+
+        self.agents_params = {}
+        self.fingerprints = {}
+        self.results = {}
+
+    def add_agent(self, name, params):
+        self.agents_params[name] = params
+        self.fingerprints[name] = get_agent_fingerprint(self.size, name, params)
+
+    def play(self, rerun=False):
+        """ Plays pairings with changed agents and returns ratings of agents """
+        stored_results = {} if rerun else self.__load_results()
+        backend = None
+
+        for name1, name2 in combinations(self.agents_params.keys(), 2):
+            key = f'{name1} vs {name2}'
+            fingerprints = [self.fingerprints[name1], self.fingerprints[name2], self.number]
+            stored = stored_results.get(key)
+            if stored is not None and stored['fingerprints'] == fingerprints:
+                print(f'{key}: stored {stored["results"]}')
+                self.results[key] = stored
+                continue
+
+            backend = backend or self.backend_factory()
+            try:
+                results = self.__play_pairing(name1, name2, backend)
+            except DomainException as e:
+                print(f'{key}: skipped, {e.message}')
+                continue
+            if results is None:
+                print(f'{key}: interrupted')
+                break
+            print(f'{key}: played {results}')
+            self.results[key] = {'fingerprints': fingerprints, 'results': results}
+            stored_results[key] = self.results[key]
+            self.__save_results(stored_results)
+
+        return compute_ratings(self.agents_params.keys(), self.results)
+
+    def __play_pairing(self, name1, name2, backend):
+        with redirect_stdout(io.StringIO()):
+            player1 = construct_agent(name1, False, self.size, self.agents_params[name1])
+            player2 = construct_agent(name2, False, self.size, self.agents_params[name2])
+
+        if self.workers > 1:
+            tournament = ParallelTournament(self.size, self.backend_factory, self.number, self.workers,
+                                            player1, player2)
+            results = tournament.play()
+            return results if not tournament.interrupted else None
+
+        gameplay = NoGuiGameplay(self.size, 0, backend)
+        with redirect_stdout(io.StringIO()):
+            gameplay.set_players(player1, player2)
+        tournament = Tournament(gameplay, self.number, player1, player2)
+        results = tournament.play()
+        return results if not tournament.interrupted else None
+
+    def __load_results(self):
+        if not self.results_path.exists():
+            return {}
+        with open(self.results_path) as f:
+            return json.load(f)
+
+    def __save_results(self, results):
+        # results are replaced atomically, so interrupted league does not lose results of played pairings
+        temporary_path = self.results_path.with_suffix('.tmp')
+        with open(temporary_path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        os.replace(temporary_path, self.results_path)
+
+
+def get_agent_fingerprint(size, name, params):
+    """ Returns hash of files with saved data of agent and of agents it depends on, and of its parameters """
+    digest = hashlib.sha256()
+    digest.update(repr(sorted(params.items())).encode())
+    try:
+        agent = agents[name](**params)
+    except TypeError as e:
+        raise DomainException(f'Invalid parameters of {name} agent: {e}')
+    for data_path in get_paths_to_agent_data_files(size, agent):
+        digest.update(data_path.name.encode())
+        with open(data_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compute_ratings(names, results, iterations=1000):
+    """
+    Returns Elo ratings, games and scores of agents fitted to pairings results with Bradley-Terry model.
+
+    Agents without played games are left out. Draws count as half of win for both agents. Ratings are found
+    with minorization-maximization iterations and shifted to average of zero.
+    """
+    names = list(names)
+    scores = {name: 0.0 for name in names}
+    games = {name: 0 for name in names}
+    pairs = []
+    for key, stored in results.items():
+        name1, name2 = key.split(' vs ')
+        wins, losses, draws = stored['results']
+        played = wins + losses + draws
+        if name1 not in scores or name2 not in scores or played == 0:
+            continue
+        scores[name1] += wins + draws / 2
+        scores[name2] += losses + draws / 2
+        games[name1] += played
+        games[name2] += played
+        pairs.append((name1, name2, played))
+    names = [name for name in names if games[name] > 0]
+
+    # half of a win and of a loss against every opponent keep strengths of agents without wins or losses finite
+    strengths = {name: 1.0 for name in names}
+    for _ in range(iterations):
+        new_strengths = {}
+        for name in names:
+            score = scores[name]
+            denominator = 0.0
+            for name1, name2, played in pairs:
+                if name in (name1, name2):
+                    opponent = name2 if name == name1 else name1
+                    score += 0.5
+                    denominator += (played + 1) / (strengths[name] + strengths[opponent])
+            new_strengths[name] = score / denominator if denominator > 0 else 1.0
+        strengths = new_strengths
+
+    elos = {name: 400 * math.log10(strength) for name, strength in strengths.items()}
+    mean_elo = sum(elos.values()) / len(elos) if elos else 0.0
+    ratings = [(name, elos[name] - mean_elo, games[name], scores[name] / games[name] if games[name] else 0.0)
+               for name in names]
+    return sorted(ratings, key=lambda rating: -rating[1])
+
+
+def parse_league_params(params, names):
+    agents_params = {name: [] for name in names}
+    for param in params:
+        name, _, agent_param = param.partition(':')
+        if name not in agents_params or not agent_param:
+            raise DomainException(f'Parameter must be in form agent:key=value with agent from league: {param}')
+        agents_params[name].append(agent_param)
+    return {name: parse_agent_params(agent_params) for name, agent_params in agents_params.items()}
+
+
+def get_path_to_league_results(size):
+    return get_path_to_agent_data(size, 'league').with_suffix('.json')
+
+
+def print_ratings(ratings):
+    print('---------------LEAGUE---------------')
+    print(f'  {"#":>2} {"agent":<14}{"elo":>7}{"games":>7}{"score":>7}')
+    for place, (name, elo, games, score) in enumerate(ratings, start=1):
+        print(f'  {place:>2} {name:<14}{elo:>7.0f}{games:>7}{score:>7.1%}')
+    print('------------------------------------')
+
+
+if __name__ == '__main__':
+    try:
+        league_command()
+    except DomainException as e:
+        print(f'ERROR: {e.message}', file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,38 @@
+from pathlib import Path
+import os
+import sys
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
+
+import click
+
+from agents.mcts_stats import PositionsStats
+from reversi import get_path_to_agent_data
+from exceptions import DomainException
+
+
+@click.command(help="Merges MCTS statistics tables saved by separate runs, e.g. on other machines, into statistics "
+                    "of the agent, statistics of the same positions are summed")
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('-s', '--size', nargs=2, type=int, default=(8, 8), help='Size of the map')
+@click.option('-a', '--agent', 'agent_name', type=click.Choice(['mcts', 'mcts_value']), default='mcts',
+              help='Agent whose statistics are merged with given ones')
+@click.option('-o', '--output', type=click.Path(dir_okay=False), default=None,
+              help='File to write merged statistics to instead of statistics of the agent')
+def merge_stats_command(paths, size, agent_name, output):
+    paths = [Path(path) for path in paths]
+    if output is None:
+        # statistics of the agent are merged with the given ones, unless they are given too
+        output = get_path_to_agent_data(tuple(size), agent_name).with_suffix(PositionsStats.SUFFIX)
+        if output.exists() and output.resolve() not in [path.resolve() for path in paths]:
+            paths.insert(0, output)
+
+    stats = PositionsStats.merge(paths, output)
+    print(f'Statistics of {len(paths)} files merged into {output}, there is {stats.entries_count} entries')
+
+
+if __name__ == '__main__':
+    try:
+        merge_stats_command()
+    except DomainException as e:
+        print(f'ERROR: {e.message}', file=sys.stderr)
+        sys.exit(1)
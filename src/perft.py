@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
+
+import click
+
+from simulation import Simulation
+from backend import LiveBackend, PreparedBackend
+from reversi import get_path_to_backend_data
+from exceptions import DomainException
+
+
+def create_prepared_backend(size):
+    return PreparedBackend(size, get_path_to_backend_data(size))
+
+
+# every backend able to generate moves, alternative engines should be registered here
+engines = {
+    'live': LiveBackend,
+    'prepared': create_prepared_backend,
+}
+
+
+@click.command(help="Counts positions reachable from the initial position in given number of moves, "
+                    "including passes, with every selected engine and checks that the counts are equal")
+@click.option('-s', '--size', nargs=2, type=int, default=(8, 8), help='Size of the map')
+@click.option('-d', '--depth', type=int, default=4, help='Number of moves')
+@click.option('-e', '--engine', 'engines_names', type=click.Choice(list(engines.keys())), multiple=True,
+              help='Engine to run, can be repeated, all engines practical for board size by default')
+def perft_command(size, depth, engines_names):
+    if not engines_names:
+        engines_names = [name for name in engines.keys()
+                         if name != 'prepared' or size[0] * size[1] <= PreparedBackend.MAX_PRACTICAL_FIELDS]
+
+    counts = {}
+    for name in engines_names:
+        backend = engines[name](size)
+        print(f'--- {name} ---')
+        counts[name] = []
+        for current_depth in range(1, depth + 1):
+            start = time.perf_counter()
+            nodes = perft(Simulation.create_initial(size, backend), current_depth)
+            elapsed = time.perf_counter() - start
+            counts[name].append(nodes)
+            print(f'  depth {current_depth:>2}: {nodes:>12} nodes {elapsed:>9.3f} s {nodes / elapsed:>12.0f} nodes/s')
+
+    reference_name, reference_counts = next(iter(counts.items()))
+    for name, engine_counts in counts.items():
+        if engine_counts != reference_counts:
+            raise DomainException(f'Engines {reference_name} and {name} diverge: {reference_counts} != {engine_counts}')
+    print(f'All engines agree: {reference_counts}')
+
+
+def perft(simulation, depth):
+    """
+    Returns number of leaf nodes of game tree of given depth.
+
+    Finished games are leaves regardless of depth. When player has to pass, the pass is a move of its own,
+    so it takes one level of the tree. Backends make passes implicitly, they are recognized by the same
+    player being to move again.
+    """
+    if depth == 0 or simulation.is_finished():
+        return 1
+
+    nodes = 0
+    for move in simulation.get_moves():
+        next_simulation = simulation.copy().make_move(move)
+        if next_simulation.turn == simulation.turn and not next_simulation.is_finished():
+            nodes += 1 if depth == 1 else perft(next_simulation, depth - 2)
+        else:
+            nodes += perft(next_simulation, depth - 1)
+    return nodes
+
+
+if __name__ == '__main__':
+    try:
+        perft_command()
+    except DomainException as e:
+        print(f'ERROR: {e.message}', file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,103 @@
+import cProfile
+import time
+from functools import wraps
+
+
+class PhaseStats:
+    """ Calls count, total time and histogram of call times with buckets growing by powers of two microseconds """
+
+    BUCKETS_COUNT = 32
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * self.BUCKETS_COUNT
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        bucket = min(int(elapsed * 1e6).bit_length(), self.BUCKETS_COUNT - 1)
+        self.histogram[bucket] += 1
+
+    def get_percentile(self, percent):
+        """ Returns upper bound of histogram bucket holding given percentile, in seconds """
+        threshold = self.count * percent / 100
+        cumulative = 0
+        for bucket, bucket_count in enumerate(self.histogram):
+            cumulative += bucket_count
+            if cumulative >= threshold:
+                return (1 << bucket) / 1e6
+        return self.max
+
+
+class Profiler:
+    """
+    Measures time spent in phases of the game by wrapping methods of given objects.
+
+    Wrapped methods record calls count and wall time of every call. Phases can nest, e.g. agent decisions
+    include backend calls made by the agent. Calls of one chosen phase can also be profiled with cProfile
+    and dumped to file. Statistics of caches of agents having cache_stats are printed with the summary.
+    """
+
+    def __init__(self, cprofile_phase=None):
+        self.phases = {}
+        self.__cached_agents = []
+        self.__cprofile_phase = cprofile_phase
+        self.__cprofile = cProfile.Profile() if cprofile_phase is not None else None
+
+    def instrument(self, obj, method_name, phase):
+        """ Replaces method of given object with wrapper measuring its calls as given phase """
+        method = getattr(obj, method_name)
+        stats = self.phases.setdefault(phase, PhaseStats())
+        cprofile = self.__cprofile if phase == self.__cprofile_phase else None
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                if cprofile is not None:
+                    return cprofile.runcall(method, *args, **kwargs)
+                return method(*args, **kwargs)
+            finally:
+                stats.add(time.perf_counter() - start)
+
+        setattr(obj, method_name, wrapper)
+
+    def instrument_gameplay(self, gameplay, backend, players):
+        """ Instruments agents decisions, backend moves, rewards and states conversions of gameplay """
+        for player in players:
+            if player is not None:
+                self.instrument(player, 'get_action', f'{player.NAME}.get_action')
+                self.instrument(player, 'update', f'{player.NAME}.update')
+                if hasattr(type(player), 'cache_stats'):
+                    self.__cached_agents.append(player)
+        self.instrument(backend, 'get_moves', 'backend.get_moves')
+        self.instrument(backend, 'make_move', 'backend.make_move')
+        self.instrument(backend, 'get_winner', 'backend.get_winner')
+        self.instrument(gameplay._env, 'get_reward', 'env.get_reward')
+        self.instrument(gameplay, '_get_state_for_player', 'gameplay.get_state_for_player')
+
+    def dump_cprofile(self, path):
+        if self.__cprofile is not None:
+            self.__cprofile.dump_stats(path)
+
+    def print_summary(self, wall_time=None):
+        print('-----------------------------------PROFILE-----------------------------------')
+        print(f'  {"phase":<32}{"calls":>10}{"total s":>10}{"mean us":>10}{"p50 us":>8}{"p99 us":>8}{"max us":>9}')
+        for phase, stats in sorted(self.phases.items(), key=lambda item: -item[1].total):
+            if stats.count == 0:
+                continue
+            print(f'  {phase:<32}{stats.count:>10}{stats.total:>10.3f}{stats.total / stats.count * 1e6:>10.1f}'
+                  f'{stats.get_percentile(50) * 1e6:>8.0f}{stats.get_percentile(99) * 1e6:>8.0f}'
+                  f'{stats.max * 1e6:>9.0f}')
+        if wall_time is not None:
+            print(f'  {"wall time":<32}{"":>10}{wall_time:>10.3f}')
+        if self.__cached_agents:
+            print(f'  {"cache":<32}{"size":>10}{"hits":>10}{"misses":>10}{"hit rate":>10}')
+        for agent in self.__cached_agents:
+            for cache, stats in agent.cache_stats.items():
+                print(f'  {f"{agent.NAME}.{cache}":<32}{stats["size"]:>10}{stats["hits"]:>10}{stats["misses"]:>10}'
+                      f'{stats["hit_rate"]:>10.1%}')
+        print('-----------------------------------------------------------------------------')
@@ -0,0 +1,141 @@
+from collections import namedtuple
+import struct
+
+from board import Color
+from exceptions import DomainException
+
+
+GameRecord = namedtuple('GameRecord', ['black', 'white', 'moves', 'winner'])
+
+
+class GamesLog:
+    """
+    Append-only binary log of played games.
+
+    File starts with header holding board size and names of two agents, then every game is stored as
+    one byte telling which agent played black, one byte per move with index of the field or pass marker,
+    end marker and one byte with winner color.
+    """
+
+    MAGIC = b'RVRSGAME'
+    VERSION = 1
+
+    PASS = 0xFE
+    END = 0xFF
+    FIRST_BLACK, SECOND_BLACK = 0, 1
+    DRAW, BLACK_WON, WHITE_WON = 0, 1, 2
+
+    BUFFER_SIZE = 1 << 16
+
+    _HEADER = struct.Struct('<8sBBB')    # magic, version, height, width
+
+    @staticmethod
+    def encode_header(size, names):
+        header = GamesLog._HEADER.pack(GamesLog.MAGIC, GamesLog.VERSION, *size)
+        for name in names:
+            encoded_name = name.encode()
+            header += bytes([len(encoded_name)]) + encoded_name
+        return header
+
+    @staticmethod
+    def read_header(f):
+        """ Returns board size and agents names read from file """
+        data = f.read(GamesLog._HEADER.size)
+        if len(data) < GamesLog._HEADER.size:
+            raise DomainException(f'File {f.name} is not a games log')
+        magic, version, height, width = GamesLog._HEADER.unpack(data)
+        if magic != GamesLog.MAGIC or version != GamesLog.VERSION:
+            raise DomainException(f'File {f.name} is not a games log')
+
+        names = []
+        for _ in range(2):
+            length = f.read(1)[0]
+            names.append(f.read(length).decode())
+        return (height, width), tuple(names)
+
+
+class GameRecorder:
+    """ Writes games played by two given agents to games log, appending to existing log of the same agents """
+
+    def __init__(self, path, size, player1, player2):
+        if size[0] * size[1] >= GamesLog.PASS:
+            raise DomainException(f'Games on {size[0]}x{size[1]} board can not be recorded')
+
+        self.__size = tuple(size)
+        self.__players = (player1, player2)
+        names = tuple(player.NAME if player is not None else 'human' for player in self.__players)
+        header = GamesLog.encode_header(self.__size, names)
+
+        try:
+            with open(path, 'rb') as f:
+                if GamesLog.read_header(f) != (self.__size, names):
+                    raise DomainException(f'Games log {path} holds games of other agents or board size')
+        except FileNotFoundError:
+            with open(path, 'wb') as f:
+                f.write(header)
+
+        self.__file = open(path, 'ab', buffering=GamesLog.BUFFER_SIZE)
+        self.__game = None
+        self.__last_color = None
+
+    def start_game(self, player_black):
+        first_black = player_black is self.__players[0]
+        self.__game = bytearray([GamesLog.FIRST_BLACK if first_black else GamesLog.SECOND_BLACK])
+        self.__last_color = Color.WHITE
+
+    def add_move(self, move, color):
+        # backends pass implicitly, so pass is recognized by the same color moving twice in a row
+        if color == self.__last_color:
+            self.__game.append(GamesLog.PASS)
+        self.__game.append(move[0] * self.__size[1] + move[1])
+        self.__last_color = color
+
+    def finish_game(self, winner_color):
+        if winner_color == Color.BLACK:
+            winner = GamesLog.BLACK_WON
+        elif winner_color == Color.WHITE:
+            winner = GamesLog.WHITE_WON
+        else:
+            winner = GamesLog.DRAW
+        self.__game += bytes([GamesLog.END, winner])
+        self.__file.write(self.__game)
+        self.__game = None
+
+    def close(self):
+        self.__file.close()
+
+
+class GamesLogReader:
+    """ Iterates lazily over games stored in games log """
+
+    def __init__(self, path):
+        self.__path = path
+        with open(path, 'rb') as f:
+            self.size, self.names = GamesLog.read_header(f)
+            self.__data_offset = f.tell()
+
+    def __iter__(self):
+        with open(self.__path, 'rb') as f:
+            f.seek(self.__data_offset)
+            buffer = b''
+            while True:
+                chunk = f.read(GamesLog.BUFFER_SIZE)
+                buffer += chunk
+                start = 0
+                while True:
+                    end = buffer.find(GamesLog.END, start)
+                    if end == -1 or end + 1 >= len(buffer):
+                        break
+                    yield self.__decode_game(buffer[start:end], buffer[end + 1])
+                    start = end + 2
+                buffer = buffer[start:]
+                if not chunk:
+                    break
+
+    def __decode_game(self, data, winner):
+        first_black = data[0] == GamesLog.FIRST_BLACK
+        black, white = self.names if first_black else self.names[::-1]
+        width = self.size[1]
+        moves = [None if field == GamesLog.PASS else (field // width, field % width) for field in data[1:]]
+        winner_color = {GamesLog.BLACK_WON: Color.BLACK, GamesLog.WHITE_WON: Color.WHITE}.get(winner, Color.ANY)
+        return GameRecord(black, white, moves, winner_color)
@@ -1,4 +1,6 @@
+from functools import partial
 from pathlib import Path
+import ast
 import os
 import sys
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
@@ -7,7 +9,11 @@ import click
 import numpy as np
 
 from agents import agents
-from gameplay import GuiGameplay, NoGuiGameplay, Tournament
+from gameplay import NoGuiGameplay, Tournament, LockstepTournament
+from profiler import Profiler
+from records import GameRecorder
+from sprt import Sprt
+from timecontrol import TimeControl
 from backend import LiveBackend, PreparedBackend
 from exceptions import DomainException
 
@@ -18,22 +24,100 @@ from exceptions import DomainException
 @click.argument('p2', type=click.Choice(list(agents.keys())), default='human')
 @click.option('-l1', is_flag=True, default=False, help='Enable learning for first player')
 @click.option('-l2', is_flag=True, default=False, help='Enable learning for second player')
+@click.option('-a1', multiple=True, help='Parameter of first player agent in form key=value')
+@click.option('-a2', multiple=True, help='Parameter of second player agent in form key=value')
 @click.option('-s', '--size', nargs=2, type=int, default=(8, 8), help='Size of the map')
 @click.option('-n', '--number', type=int, default=1, help='Number of game repeats')
 @click.option('-d', '--delay', type=float, default=0.05, help='Minimum delay between player moves in ms')
 @click.option('--live/--prepared', default=True, help='Whether use live or prepared backend')
 @click.option('--gui/--nogui', default=True, help='Whether graphical interface should be shown')
-def reversi(p1, p2, l1, l2, size, number, delay, live, gui):
-    player1 = construct_agent(p1, l1, size)
-    player2 = construct_agent(p2, l2, size)
+@click.option('-w', '--workers', type=int, default=1, help='Number of worker processes playing games')
+@click.option('-k', '--lockstep', type=int, default=1, help='Number of games advanced together by not learning agents')
+@click.option('--profile', is_flag=True, default=False, help='Measure time spent in phases of the games')
+@click.option('--profile-phase', default=None, help='Phase of the games to profile with cProfile')
+@click.option('--record', type=click.Path(dir_okay=False), default=None, help='Games log file to append games to')
+@click.option('--sprt', 'sprt_elo', nargs=2, type=float, default=None, metavar='ELO0 ELO1',
+              help='Stop when SPRT decides whether first player Elo advantage is ELO0 or ELO1')
+@click.option('--sprt-score', nargs=2, type=float, default=None, metavar='SCORE0 SCORE1',
+              help='Stop when SPRT decides whether first player score is SCORE0 or SCORE1')
+@click.option('--sprt-errors', nargs=2, type=float, default=(0.05, 0.05), metavar='ALPHA BETA',
+              help='False positive and false negative probabilities of SPRT')
+@click.option('-t', '--time-control', default=None, metavar='SECONDS|BASE+INCREMENT',
+              help='Time of every move or time of game and increment per move of every agent')
+@click.option('--ponder', is_flag=True, default=False, help="Let agents think during opponent's turn")
+@click.option('--float16', is_flag=True, default=False, help='Save tables of action values with float16 values')
+@click.option('--checkpoint', type=int, default=1000, help='Number of games between saves of learning agents data')
+@click.option('--listen', default=None, metavar='[HOST:]PORT',
+              help='Train with remote workers connecting to address, localhost by default')
+@click.option('--secret', envvar='REVERSI_SECRET', default=None,
+              help='Secret shared with remote workers, REVERSI_SECRET environment variable by default')
+def reversi(p1, p2, l1, l2, a1, a2, size, number, delay, live, gui, workers, lockstep, profile, profile_phase,
+            record, sprt_elo, sprt_score, sprt_errors, time_control, ponder, float16, checkpoint, listen, secret):
+    params1, params2 = parse_agent_params(a1), parse_agent_params(a2)
+    player1 = construct_agent(p1, l1, size, params1, float16)
+    player2 = construct_agent(p2, l2, size, params2, float16)
 
-    backend = LiveBackend(size) if live else PreparedBackend(size, get_path_to_backend_data(size))
+    profile = profile or profile_phase is not None
+    if profile and (listen is not None or workers > 1 or lockstep > 1):
+        raise DomainException('Only games played one by one in one process can be profiled')
+    if record is not None and (listen is not None or workers > 1 or lockstep > 1):
+        raise DomainException('Only games played one by one in one process can be recorded')
 
-    gameplay_class = GuiGameplay if gui else NoGuiGameplay
-    gameplay = gameplay_class(size, delay, backend)
+    sprt = create_sprt(sprt_elo, sprt_score, sprt_errors)
+    if sprt is not None and (listen is not None or workers > 1 or lockstep > 1):
+        raise DomainException('Only games played one by one in one process can be stopped by SPRT')
+
+    if time_control is not None:
+        time_control = TimeControl.parse(time_control)
+    if (time_control is not None or ponder) and (listen is not None or workers > 1 or lockstep > 1):
+        raise DomainException('Only games played one by one in one process can have time control')
+
+    if live:
+        backend_factory = partial(LiveBackend, size)
+    else:
+        backend_factory = partial(PreparedBackend, size, get_path_to_backend_data(size))
+
+    if listen is not None:
+        results = train_distributed(player1, player2, params1, params2, size, live, number, gui, listen, secret,
+                                    backend_factory)
+    elif workers > 1 and not is_learning(player1) and not is_learning(player2):
+        results = play_in_parallel(player1, player2, size, number, gui, workers, backend_factory)
+    elif workers > 1:
+        results = train_in_parallel(player1, player2, size, number, gui, workers, backend_factory)
+    elif lockstep > 1:
+        if gui:
+            raise DomainException('Lockstep games can not be shown in GUI')
+        tournament = LockstepTournament(size, backend_factory(), number, player1, player2, lockstep)
+        results = tournament.play()
+    else:
+        backend = backend_factory()
+        gameplay_class = get_gui_gameplay_class() if gui else NoGuiGameplay
+        gameplay = gameplay_class(size, delay, backend)
+        gameplay.set_time_control(time_control, ponder)
+
+        profiler = None
+        if profile:
+            profiler = Profiler(profile_phase)
+            profiler.instrument_gameplay(gameplay, backend, [player1, player2])
+            if profile_phase is not None and profile_phase not in profiler.phases:
+                raise DomainException(f'Unknown phase {profile_phase}, choose one of: {", ".join(profiler.phases)}')
+
+        recorder = None
+        if record is not None:
+            recorder = GameRecorder(record, size, player1, player2)
+            gameplay.set_recorder(recorder)
+
+        checkpoint_players = partial(checkpoint_agents_data, [player1, player2], size)
+        tournament = Tournament(gameplay, number, player1, player2, profiler, sprt, checkpoint_players, checkpoint)
+        results = tournament.play()
+
+        if recorder is not None:
+            recorder.close()
+
+        if profile_phase is not None:
+            profiler.dump_cprofile(f'{profile_phase}.prof')
+            print(f'cProfile statistics of {profile_phase} saved in {profile_phase}.prof')
 
-    tournament = Tournament(gameplay, number, player1, player2)
-    results = tournament.play()
     percent_results = np.array(results) / np.sum(results) * 100
 
     print('------------RESULTS------------')
@@ -46,14 +130,91 @@ def reversi(p1, p2, l1, l2, size, number, delay, live, gui):
     save_agent_data(player2, size)
 
 
-def construct_agent(name, learn, size):
+def get_gui_gameplay_class():
+    # pygame takes long to import, so it is imported only when GUI is shown
+    from gui import GuiGameplay
+    return GuiGameplay
+
+
+def train_in_parallel(player1, player2, size, number, gui, workers, backend_factory):
+    from training import ParallelTraining
+    validate_training_players(player1, player2, gui)
+
+    learner, opponent = (player1, player2) if player1.learn else (player2, player1)
+    training = ParallelTraining(size, backend_factory, number, workers, learner, opponent)
+    results = training.play()
+    return results if learner is player1 else [results[1], results[0], results[2]]
+
+
+def play_in_parallel(player1, player2, size, number, gui, workers, backend_factory):
+    if gui:
+        raise DomainException('Games with many workers can not be shown in GUI')
+    if None in [player1, player2]:
+        raise DomainException('Human players are not allowed in games with many workers')
+
+    from training import ParallelTournament
+    tournament = ParallelTournament(size, backend_factory, number, workers, player1, player2)
+    return tournament.play()
+
+
+def train_distributed(player1, player2, params1, params2, size, live, number, gui, listen, secret,
+                      backend_factory):
+    from distributed import DistributedTraining
+    validate_training_players(player1, player2, gui)
+    if not secret:
+        raise DomainException('Training with remote workers needs secret shared with them')
+
+    learner, opponent = (player1, player2) if player1.learn else (player2, player1)
+    learner_params, opponent_params = (params1, params2) if learner is player1 else (params2, params1)
+    training = DistributedTraining(parse_address(listen), size, live, number, learner, opponent,
+                                   learner_params, opponent_params, get_paths_to_agent_data_files(size, opponent),
+                                   backend_factory(), secret)
+    results = training.play()
+    return results if learner is player1 else [results[1], results[0], results[2]]
+
+
+def validate_training_players(player1, player2, gui):
+    if gui:
+        raise DomainException('Games with many workers can not be shown in GUI')
+    if None in [player1, player2]:
+        raise DomainException('Human players are not allowed in games with many workers')
+    if player1.learn == player2.learn:
+        raise DomainException('Exactly one player must be learning in games with many workers')
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    if not port.isdigit():
+        raise DomainException(f'Address must be in form [HOST:]PORT: {address}')
+    return host or 'localhost', int(port)
+
+
+def create_sprt(sprt_elo, sprt_score, sprt_errors):
+    if sprt_elo is not None and sprt_score is not None:
+        raise DomainException('SPRT hypotheses can be given either as Elo or as score')
+    if sprt_elo is not None:
+        return Sprt.from_elo(*sprt_elo, *sprt_errors)
+    if sprt_score is not None:
+        return Sprt(*sprt_score, *sprt_errors)
+    return None
+
+
+def is_learning(agent):
+    return agent is not None and agent.learn
+
+
+def construct_agent(name, learn, size, params=None, half_precision=False):
     agent_class = agents[name]
 
     if agent_class is None:     # real human - special case
         return None
 
-    agent = agent_class()
+    try:
+        agent = agent_class(**(params or {}))
+    except TypeError as e:
+        raise DomainException(f'Invalid parameters of {name} agent: {e}')
     agent.learn = learn
+    agent.half_precision = half_precision
 
     path_to_agent_data = get_path_to_agent_data(size, agent.NAME)
     agent.load_data(path_to_agent_data)
@@ -61,6 +222,19 @@ def construct_agent(name, learn, size):
     return agent
 
 
+def parse_agent_params(params):
+    parsed_params = {}
+    for param in params:
+        if '=' not in param:
+            raise DomainException(f'Agent parameter must be in form key=value: {param}')
+        key, value = param.split('=', 1)
+        try:
+            parsed_params[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            parsed_params[key] = value
+    return parsed_params
+
+
 def save_agent_data(agent, size):
     if agent is None or agent.learn is False:
         return
@@ -68,6 +242,12 @@ def save_agent_data(agent, size):
     agent.save_data(path_to_agent_data)
 
 
+def checkpoint_agents_data(agents_to_save, size):
+    for agent in agents_to_save:
+        if agent is not None and agent.learn:
+            agent.checkpoint_data(get_path_to_agent_data(size, agent.NAME))
+
+
 def get_path_to_agent_data(size, agent_name):
     root_path = Path(__file__).parent.parent
     size_directory = f'{size[0]}x{size[1]}'
@@ -77,6 +257,15 @@ def get_path_to_agent_data(size, agent_name):
     return directory / filename
 
 
+def get_paths_to_agent_data_files(size, agent):
+    """ Returns files with saved data of agent and of agents it depends on, whatever format they are saved in """
+    paths = []
+    for name in [agent.NAME, *agent.get_data_dependencies()]:
+        path = get_path_to_agent_data(size, name)
+        paths.extend(data_path for data_path in sorted(path.parent.glob(f'{name}.*')) if data_path.suffix != '.tmp')
+    return paths
+
+
 def get_path_to_backend_data(size):
     root_path = Path(__file__).parent.parent
     size_directory = f'{size[0]}x{size[1]}'
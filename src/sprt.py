@@ -0,0 +1,100 @@
+import math
+
+from exceptions import DomainException
+
+
+class Sprt:
+    """
+    Sequential probability ratio test of first player strength.
+
+    Hypotheses are given as expected scores of first player (win is 1, draw is 0.5), H0 that the score is
+    score0 and H1 that it is score1. Log-likelihood ratio of results is approximated with normal distribution
+    of game score, the test stops when it leaves bounds following from alpha and beta error probabilities.
+    The approximation is poor for few games, so decisions are not made before min_games games.
+    """
+
+    H0, H1 = 'H0', 'H1'
+    DEFAULT_MIN_GAMES = 20
+
+    def __init__(self, score0, score1, alpha=0.05, beta=0.05, min_games=DEFAULT_MIN_GAMES):
+        if not 0 < score0 < 1 or not 0 < score1 < 1 or score0 == score1:
+            raise DomainException('SPRT hypotheses must be different scores between 0 and 1')
+        if not 0 < alpha < 1 or not 0 < beta < 1:
+            raise DomainException('SPRT error probabilities must be between 0 and 1')
+
+        self.score0 = score0
+        self.score1 = score1
+        self.alpha = alpha
+        self.beta = beta
+        self.min_games = min_games
+        self.lower_bound = math.log(beta / (1 - alpha))
+        self.upper_bound = math.log((1 - beta) / alpha)
+
+    @staticmethod
+    def from_elo(elo0, elo1, alpha=0.05, beta=0.05, min_games=DEFAULT_MIN_GAMES):
+        """ Creates test of hypotheses given as Elo difference of first player over the second one """
+        return Sprt(Sprt.elo_to_score(elo0), Sprt.elo_to_score(elo1), alpha, beta, min_games)
+
+    @staticmethod
+    def elo_to_score(elo):
+        return 1 / (1 + 10 ** (-elo / 400))
+
+    @staticmethod
+    def score_to_elo(score):
+        score = min(max(score, 1e-6), 1 - 1e-6)
+        return -400 * math.log10(1 / score - 1)
+
+    def get_llr(self, results):
+        """ Returns log-likelihood ratio of H1 to H0 for first player wins, second player wins and draws """
+        wins, losses, draws = results
+        games = wins + losses + draws
+        if games == 0:
+            return 0.0
+
+        score, variance = self.__get_score_and_variance(wins, losses, draws)
+        return games * (self.score1 - self.score0) * (2 * score - self.score0 - self.score1) / (2 * variance)
+
+    @staticmethod
+    def __get_score_and_variance(wins, losses, draws):
+        games = wins + losses + draws
+        score = (wins + draws / 2) / games
+        variance = (wins * (1 - score) ** 2 + losses * score ** 2 + draws * (0.5 - score) ** 2) / games
+        if variance == 0:
+            # all games ended the same way, so variance is estimated with half of win and half of loss added
+            games += 1
+            regularized_score = (wins + 0.5 + draws / 2) / games
+            variance = ((wins + 0.5) * (1 - regularized_score) ** 2 + (losses + 0.5) * regularized_score ** 2
+                        + draws * (0.5 - regularized_score) ** 2) / games
+        return score, variance
+
+    def get_decision(self, results):
+        """ Returns accepted hypothesis or None when test should continue """
+        if sum(results) < self.min_games:
+            return None
+        llr = self.get_llr(results)
+        if llr >= self.upper_bound:
+            return self.H1
+        if llr <= self.lower_bound:
+            return self.H0
+        return None
+
+    def get_summary(self, results):
+        games = sum(results)
+        score, variance = self.__get_score_and_variance(*results) if games > 0 else (0.5, 0.25)
+        error = 1.96 * math.sqrt(variance / max(games, 1))
+
+        decision = self.get_decision(results)
+        llr = self.get_llr(results)
+        if decision == self.H1:
+            verdict = f'H1 accepted (score >= {self.score1:.3f}), false positive probability <= {self.alpha}'
+        elif decision == self.H0:
+            verdict = f'H0 accepted (score <= {self.score0:.3f}), false negative probability <= {self.beta}'
+        else:
+            verdict = 'undecided'
+
+        return [
+            f'SPRT: {verdict}',
+            f'  LLR: {llr:.3f} (bounds {self.lower_bound:.3f}, {self.upper_bound:.3f}) after {games} games',
+            f'  Score: {score:.3f} +- {error:.3f}, Elo: {self.score_to_elo(score):.1f} '
+            f'[{self.score_to_elo(score - error):.1f}, {self.score_to_elo(score + error):.1f}]',
+        ]
@@ -0,0 +1,59 @@
+import time
+
+from exceptions import DomainException
+
+
+class TimeControl:
+    """
+    Time given to agents for their decisions in a game.
+
+    Either every move has fixed time, or every player has time for whole game increased by increment after every
+    move. Then time of a move is remaining time divided by number of moves the player probably still has to make,
+    which is half of empty fields. Agents are not interrupted after deadline, so time of slow decisions is only
+    counted and clocks may go below zero.
+    """
+
+    MIN_MOVE_TIME = 0.001
+
+    def __init__(self, move_time=None, game_time=None, increment=0.0):
+        if (move_time is None) == (game_time is None):
+            raise DomainException('Time control needs either time of move or time of game')
+        if (move_time is not None and move_time <= 0) or (game_time is not None and game_time <= 0) or increment < 0:
+            raise DomainException('Time control times must be positive')
+
+        self.move_time = move_time
+        self.game_time = game_time
+        self.increment = increment
+        self.__remaining = {}
+
+    @staticmethod
+    def parse(text):
+        """ Creates time control from seconds per move, e.g. 0.5, or seconds per game and increment, e.g. 60+1 """
+        try:
+            if '+' in text:
+                game_time, increment = text.split('+')
+                return TimeControl(game_time=float(game_time), increment=float(increment))
+            return TimeControl(move_time=float(text))
+        except ValueError:
+            raise DomainException(f'Time control must be in form SECONDS or BASE+INCREMENT: {text}')
+
+    def start_game(self):
+        self.__remaining = {}
+
+    def get_remaining(self, player):
+        return self.__remaining.get(player, self.game_time)
+
+    def get_deadline(self, player, empty_fields):
+        """ Returns time of time.perf_counter by which player should make move """
+        if self.move_time is not None:
+            return time.perf_counter() + self.move_time
+
+        remaining = self.get_remaining(player)
+        moves_left = max(empty_fields // 2, 1)
+        move_time = min(remaining / moves_left + self.increment, remaining)
+        return time.perf_counter() + max(move_time, self.MIN_MOVE_TIME)
+
+    def charge(self, player, elapsed):
+        """ Subtracts time of player decision from its clock """
+        if self.game_time is not None:
+            self.__remaining[player] = self.get_remaining(player) - elapsed + self.increment
@@ -0,0 +1,358 @@
+import multiprocessing
+import pickle
+import queue
+import signal
+import traceback
+
+from tqdm import tqdm
+
+from gameplay import NoGuiGameplay
+from exceptions import DomainException
+
+
+class RecordingGameplay(NoGuiGameplay):
+    """ Gameplay which records transitions of learner agent instead of updating it """
+
+    def __init__(self, size, delay, backend, learner):
+        super().__init__(size, delay, backend)
+        self.__learner = learner
+        self.__transitions = []
+
+    def pop_transitions(self):
+        transitions = self.__transitions
+        self.__transitions = []
+        return transitions
+
+    def _notify_agent(self, player, state, action, reward, next_state):
+        if player is self.__learner:
+            self.__transitions.append((state, action, reward, next_state))
+        else:
+            super()._notify_agent(player, state, action, reward, next_state)
+
+
+class ParallelTraining:
+    """
+    Trains agent on games played by worker processes.
+
+    Every worker plays games with its own copy of learner agent and opponent, and sends back transitions
+    of learner agent. Main process applies them to learner agent and periodically sends its data to workers.
+    """
+
+    TRAINABLE_AGENTS = ['q_learning', 'sarsa', 'exp_sarsa', 'dq_learning', 'sarsa_lambda', 'value_approx', 'ntuple']
+    DEFAULT_BATCH_GAMES = 10
+    DEFAULT_SYNC_INTERVAL = 50
+
+    def __init__(
+            self,
+            size,
+            backend_factory,
+            number,
+            workers,
+            learner,
+            opponent,
+            batch_games=DEFAULT_BATCH_GAMES,
+            sync_interval=DEFAULT_SYNC_INTERVAL
+    ):
+        if learner.NAME not in self.TRAINABLE_AGENTS:
+            raise DomainException(f'Agent {learner.NAME} can not be trained in parallel')
+
+        self.size = size
+        self.backend_factory = backend_factory
+        self.number = number
+        self.workers = workers
+        self.learner = learner
+        self.opponent = opponent
+        self.batch_games = batch_games
+        self.sync_interval = sync_interval
+
+        self.interrupted = False
+        self.results = None
+
+    def play(self):
+        """ Returns learner wins, opponent wins and draws """
+        self.results = [0, 0, 0]
+
+        # backend is created before workers start, so prepared backend data is built only once and inherited by them
+        backend = self.backend_factory()
+
+        # workers get copies of agents before they are bound to main process environment
+        context = multiprocessing.get_context('fork')
+        results_queue = context.Queue()
+        tasks_queues = [context.Queue() for _ in range(self.workers)]
+        processes = [
+            context.Process(
+                target=_worker_main,
+                args=(worker_id, self.size, backend, self.learner, self.opponent,
+                      tasks_queues[worker_id], results_queue),
+                daemon=True
+            )
+            for worker_id in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+
+        gameplay = NoGuiGameplay(self.size, 0, backend)
+        gameplay.set_players(self.learner, self.opponent)
+
+        signal.signal(signal.SIGINT, self.__interrupt_handler)
+        try:
+            self.__learn_loop(tasks_queues, results_queue, processes)
+        finally:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            for tasks_queue in tasks_queues:
+                tasks_queue.put(None)
+            for process in processes:
+                process.join()
+
+        return self.results
+
+    def __learn_loop(self, tasks_queues, results_queue, processes):
+        assigned_games = 0
+        finished_games = 0
+        synced_games = 0
+        needs_sync = [False] * self.workers
+        pending_tasks = 0
+
+        # two tasks per worker, so worker does not wait while its results are applied
+        for _ in range(2):
+            for worker_id, tasks_queue in enumerate(tasks_queues):
+                games = min(self.batch_games, self.number - assigned_games)
+                if games > 0:
+                    tasks_queue.put((games, None))
+                    assigned_games += games
+                    pending_tasks += 1
+
+        tqdm_iterator = tqdm(total=self.number, desc='Training', unit=' play')
+
+        while pending_tasks > 0:
+            worker_id, games = _get_worker_result(results_queue, processes)
+            pending_tasks -= 1
+
+            for transitions, result in games:
+                apply_recorded_game(self.learner, transitions)
+                self.results[result] += 1
+            finished_games += len(games)
+            tqdm_iterator.update(len(games))
+            tqdm_iterator.set_postfix_str(f'Wins: {self.results[0]}/{self.results[1]}/{self.results[2]}')
+
+            if finished_games - synced_games >= self.sync_interval:
+                synced_games = finished_games
+                needs_sync = [True] * self.workers
+
+            games = min(self.batch_games, self.number - assigned_games)
+            if games > 0 and not self.interrupted:
+                data = self.learner.get_data_to_save() if needs_sync[worker_id] else None
+                needs_sync[worker_id] = False
+                tasks_queues[worker_id].put((games, data))
+                assigned_games += games
+                pending_tasks += 1
+
+        tqdm_iterator.close()
+
+    def __interrupt_handler(self, _sigint, _frame):
+        self.interrupted = True
+
+
+class ParallelTournament:
+    """
+    Plays games of not learning agents in worker processes.
+
+    Games are handed out in batches with their index in the tournament, so every worker sets colours of players
+    the same way as serial tournament would, where players swap colours after every game.
+    """
+
+    DEFAULT_BATCH_GAMES = 10
+
+    def __init__(self, size, backend_factory, number, workers, player1, player2, batch_games=DEFAULT_BATCH_GAMES):
+        if player1.learn or player2.learn:
+            raise DomainException('Learning agents can not play in parallel tournament')
+
+        self.size = size
+        self.backend_factory = backend_factory
+        self.number = number
+        self.workers = workers
+        self.player1 = player1
+        self.player2 = player2
+        self.batch_games = batch_games
+
+        self.interrupted = False
+        self.results = None
+
+    def play(self):
+        """ Returns first player wins, second player wins and draws """
+        self.results = [0, 0, 0]
+
+        # backend is created before workers start, so prepared backend data is built only once and inherited by them
+        backend = self.backend_factory()
+
+        context = multiprocessing.get_context('fork')
+        tasks_queue = context.Queue()
+        results_queue = context.Queue()
+
+        tasks_count = 0
+        for start in range(0, self.number, self.batch_games):
+            tasks_queue.put((start, min(self.batch_games, self.number - start)))
+            tasks_count += 1
+        for _ in range(self.workers):
+            tasks_queue.put(None)
+
+        processes = [
+            context.Process(
+                target=_tournament_worker_main,
+                args=(self.size, backend, self.player1, self.player2, tasks_queue, results_queue),
+                daemon=True
+            )
+            for _ in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+
+        signal.signal(signal.SIGINT, self.__interrupt_handler)
+        try:
+            self.__collect_loop(tasks_count, results_queue, processes)
+        finally:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # workers still playing are not needed after interruption or failure of any of them
+            for process in processes:
+                process.terminate()
+                process.join()
+
+        return self.results
+
+    def __collect_loop(self, tasks_count, results_queue, processes):
+        tqdm_iterator = tqdm(total=self.number, desc='Playing', unit=' play')
+
+        for _ in range(tasks_count):
+            results = _get_worker_result(results_queue, processes)
+            self.results = [total + result for total, result in zip(self.results, results)]
+            tqdm_iterator.update(sum(results))
+            tqdm_iterator.set_postfix_str(f'Wins: {self.results[0]}/{self.results[1]}/{self.results[2]}')
+
+            if self.interrupted:
+                break
+
+        tqdm_iterator.close()
+
+    def __interrupt_handler(self, _sigint, _frame):
+        self.interrupted = True
+
+
+def _worker_main(worker_id, size, backend, learner, opponent, tasks_queue, results_queue):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        _play_training_tasks(worker_id, size, backend, learner, opponent, tasks_queue, results_queue)
+    except Exception as e:
+        results_queue.put(_WorkerError(e))
+
+
+def _play_training_tasks(worker_id, size, backend, learner, opponent, tasks_queue, results_queue):
+    gameplay = RecordingGameplay(size, 0, backend, learner)
+    gameplay.set_players(learner, opponent)
+    if worker_id % 2 == 1:
+        gameplay.swap_players()
+
+    while True:
+        task = tasks_queue.get()
+        if task is None:
+            break
+
+        games_count, data = task
+        if data is not None:
+            learner.set_saved_data(data)
+            learner.initialize()
+
+        results_queue.put((worker_id, play_recorded_games(gameplay, learner, opponent, games_count)))
+
+
+def _tournament_worker_main(size, backend, player1, player2, tasks_queue, results_queue):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        _play_tournament_tasks(size, backend, player1, player2, tasks_queue, results_queue)
+    except Exception as e:
+        results_queue.put(_WorkerError(e))
+
+
+def _play_tournament_tasks(size, backend, player1, player2, tasks_queue, results_queue):
+    gameplay = NoGuiGameplay(size, 0, backend)
+    gameplay.set_players(player1, player2)
+    player1_black = True
+
+    while True:
+        task = tasks_queue.get()
+        if task is None:
+            break
+
+        # first player is black in games with even index
+        start, games_count = task
+        if player1_black != (start % 2 == 0):
+            gameplay.swap_players()
+            player1_black = not player1_black
+
+        results = [0, 0, 0]
+        for _ in range(games_count):
+            winner = gameplay.play()
+            results[0 if winner is player1 else (1 if winner is player2 else 2)] += 1
+            gameplay.reset()
+            gameplay.swap_players()
+            player1_black = not player1_black
+
+        results_queue.put(results)
+
+
+class _WorkerError:
+    """ Exception raised in worker process, sent to main process instead of results """
+
+    def __init__(self, error):
+        if not isinstance(error, DomainException):
+            traceback.print_exc()
+        try:
+            pickle.dumps(error)
+            self.error = error
+        except Exception:
+            self.error = DomainException(f'Worker process failed with {type(error).__name__}: {error}')
+
+
+_RESULT_POLL_INTERVAL = 1.0
+
+
+def _get_worker_result(results_queue, processes):
+    """
+    Returns next result sent by workers.
+
+    Exception of worker is raised again in main process. Worker which died without sending its exception,
+    e.g. was killed, raises exception too, as its tasks will never be finished.
+    """
+    while True:
+        # results sent before exit are in queue before worker is seen dead, so they are not lost
+        crashed = any(process.exitcode not in (None, 0) for process in processes)
+        finished = all(process.exitcode is not None for process in processes)
+        try:
+            result = results_queue.get(timeout=_RESULT_POLL_INTERVAL)
+        except queue.Empty:
+            if crashed or finished:
+                raise DomainException('Worker process exited without sending its results')
+            continue
+
+        if isinstance(result, _WorkerError):
+            raise result.error
+        return result
+
+
+def play_recorded_games(gameplay, learner, opponent, games_count):
+    """ Plays games with recording gameplay and returns list of (learner transitions, result) of every game """
+    games = []
+    for _ in range(games_count):
+        winner = gameplay.play()
+        result = 0 if winner is learner else (1 if winner is opponent else 2)
+        games.append((gameplay.pop_transitions(), result))
+        gameplay.reset()
+        gameplay.swap_players()
+    return games
+
+
+def apply_recorded_game(learner, transitions):
+    """ Teaches learner with transitions recorded in one game """
+    learner.before_gameplay()
+    for state, action, reward, next_state in transitions:
+        learner.update(state, action, reward, next_state)
+    learner.after_gameplay()
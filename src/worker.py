@@ -0,0 +1,28 @@
+import os
+import sys
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
+
+import click
+
+from distributed import run_worker
+from reversi import parse_address, get_path_to_backend_data
+from exceptions import DomainException
+
+
+@click.command(help="Connects to training coordinator started with reversi.py --listen and plays games it hands out")
+@click.argument('address', metavar='[HOST:]PORT')
+@click.option('--secret', envvar='REVERSI_SECRET', required=True,
+              help='Secret shared with coordinator, REVERSI_SECRET environment variable by default')
+def worker(address, secret):
+    try:
+        run_worker(parse_address(address), secret, get_path_to_backend_data)
+    except ConnectionError as e:
+        raise DomainException(f'Connection to coordinator lost: {e}')
+
+
+if __name__ == '__main__':
+    try:
+        worker()
+    except DomainException as e:
+        print(f'ERROR: {e.message}', file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# modules of the game live in src directory and are imported by their names, as when scripts are run from it
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
@@ -0,0 +1,27 @@
+from functools import partial
+
+import pytest
+
+import reversi
+from backend import LiveBackend
+from league import League
+
+SIZE = (4, 4)
+
+
+@pytest.fixture(autouse=True)
+def agents_data_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(reversi, 'get_path_to_agent_data', lambda size, name: tmp_path / f'{name}.pickle')
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_pairing_with_failing_agent_is_skipped(tmp_path, workers):
+    league = League(SIZE, 4, partial(LiveBackend, SIZE), workers, tmp_path / 'league.json')
+    league.add_agent('random', {})
+    league.add_agent('value_iter', {})
+    league.add_agent('mcts', {})
+
+    league.play()
+
+    assert set(league.results) == {'random vs mcts'}
+    assert sum(league.results['random vs mcts']['results']) == 4
@@ -0,0 +1,29 @@
+import pytest
+from click.testing import CliRunner
+
+from agents.mcts_stats import PositionsStats
+from merge_stats import merge_stats_command
+
+
+def save_stats(path, updates):
+    stats = PositionsStats()
+    for position, reward in updates:
+        stats.update(position, reward)
+    stats.save(path)
+
+
+def test_merge_sums_statistics_of_runs(tmp_path):
+    first_path, second_path, merged_path = tmp_path / 'first.stats', tmp_path / 'second.stats', tmp_path / 'merged.stats'
+    save_stats(first_path, [(5, 1.0), (5, -1.0), (7, 1.0)])
+    # position with key wider than keys of the first file
+    save_stats(second_path, [(5, 1.0), (1 << 40, -1.0)])
+
+    result = CliRunner().invoke(merge_stats_command, [str(first_path), str(second_path), '-o', str(merged_path)])
+
+    assert result.exit_code == 0, result.output
+    merged = PositionsStats.open(merged_path)
+    assert merged.segments_count == 1
+    assert merged.get(5) == pytest.approx((1.0, 3))
+    assert merged.get(7) == pytest.approx((1.0, 1))
+    assert merged.get(1 << 40) == pytest.approx((-1.0, 1))
+    assert merged.get(9) == (0.0, 0)